@@ -27,14 +27,15 @@ const App: React.FC = () => {
       }
 
       // 2. Télécharger le contenu brut
-      const rawHtml = await fetchBookContent(htmlUrl);
+      const rawHtml = await fetchBookContent(htmlUrl, book.id);
       
       // 3. Afficher tel quel
       setSelectedBook({
         title: book.title,
         author: book.authors.map(a => a.name).join(", "),
         htmlContent: rawHtml,
-        htmlUrl: htmlUrl
+        htmlUrl: htmlUrl,
+        bookId: book.id
       });
       
       setCurrentView('reading');
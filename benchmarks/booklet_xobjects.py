@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+booklet_xobjects.py
+Mesure le temps d'imposition et la taille du livret produit par
+booklet.create_booklet_pdf sur une entrée synthétique (600 pages par défaut),
+et compte les Form XObjects embarqués : ils doivent suivre le nombre de pages
+source uniques, pas le nombre de placements.
+Usage:
+    python benchmarks/booklet_xobjects.py [--pages 600] [--signature 16] [--repeat 3]
+"""
+from pathlib import Path
+import argparse
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import fitz  # PyMuPDF
+import booklet
+import corpus
+
+def count_form_xobjects(path):
+    with fitz.open(path) as doc:
+        return sum(1 for xref in range(1, doc.xref_length()) if doc.xref_get_key(xref, "Subtype")[1] == "/Form")
+
+def run(input_path, output_path, repeat, **options):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        booklet.create_booklet_pdf(input_path, output_path, **options)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, os.path.getsize(output_path), count_form_xobjects(output_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'imposition (XObjects partagés).")
+    parser.add_argument("--pages", type=int, default=600, help="Pages de l'entrée synthétique. Default 600")
+    parser.add_argument("--signature", type=int, default=16, help="Pages par carnet. Default 16")
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions (meilleur temps retenu). Default 3")
+    args = parser.parse_args()
+    configs = [
+        ("gb, pad blank", dict(gb=True, pad_mode="blank")),
+        ("gb, pad last", dict(gb=True, pad_mode="last")),
+        ("book, pad blank", dict(book=True, pad_mode="blank")),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "input.pdf")
+        output_path = os.path.join(tmp, "output.pdf")
+        corpus.make_source_pdf(input_path, args.pages, width=booklet.A4_WIDTH_PT, height=booklet.A4_HEIGHT_PT, lines=40)
+        print(f"input: {args.pages} pages, {os.path.getsize(input_path)} bytes, signature {args.signature}")
+        print(f"{'config':<18}{'time (s)':>10}{'size (bytes)':>14}{'xobjects':>10}{'bytes/src page':>16}")
+        for name, options in configs:
+            elapsed, size, xobjects = run(input_path, output_path, args.repeat, signature=args.signature, **options)
+            print(f"{name:<18}{elapsed:>10.3f}{size:>14}{xobjects:>10}{size / args.pages:>16.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+corpus.py
+Fixtures synthétiques pour les benchmarks : livres HTML au format Project
+Gutenberg (en-tête, marqueurs START/END, table des matières, chapitres,
+paragraphes, images, licence) et PDF source pour l'imposition.
+"""
+import base64
+import random
+
+import fitz  # PyMuPDF
+
+def make_jpeg(width=400, height=300):
+    """Illustration JPEG (dégradé) générée localement : aucun accès réseau au rendu."""
+    samples = bytearray()
+    for y in range(height):
+        for x in range(width):
+            samples += bytes((x * 255 // width, y * 255 // height, 128))
+    return fitz.Pixmap(fitz.csRGB, width, height, bytes(samples), False).tobytes("jpeg", jpg_quality=85)
+
+WORDS = (
+    "le la les un une des et ou mais donc car ni que qui quoi dont où il elle ils elles "
+    "nous vous maison jardin route soleil nuit jour homme femme enfant lettre livre ville "
+    "mer montagne forêt rivière silence regard parole pensée mémoire temps heure amour "
+    "marcher parler voir venir partir revenir écrire lire penser croire savoir vouloir"
+).split()
+
+def to_roman(n):
+    values = ((1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+              (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I"))
+    out = []
+    for value, numeral in values:
+        while n >= value:
+            out.append(numeral)
+            n -= value
+    return "".join(out)
+
+def _paragraph(rng, words=80):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return f"<p>{text[0].upper()}{text[1:]}.</p>\n"
+
+def make_gutenberg_html(target_bytes, chapters=None, images_every=25, seed=0, title="Livre synthétique"):
+    """
+    Livre HTML façon Gutenberg d'environ `target_bytes` octets. Le nombre de
+    chapitres vaut par défaut un chapitre par ~40 Ko ; une image (JPEG en
+    data URI, comptée dans la taille) est insérée tous les `images_every`
+    paragraphes (0 = aucune).
+    """
+    rng = random.Random(seed)
+    image_uri = "data:image/jpeg;base64," + base64.b64encode(make_jpeg()).decode("ascii") if images_every else ""
+    chapters = chapters or max(1, target_bytes // 40000)
+    header = (
+        "<!DOCTYPE html>\n<html lang=\"fr\">\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>The Project Gutenberg eBook of {title}</title>\n"
+        "<style>p { text-indent: 1em; } .pg-boilerplate { font-size: small; }</style>\n"
+        "</head>\n<body>\n"
+        "<section class=\"pg-boilerplate pgheader\" id=\"pg-header\">\n"
+        f"<h2>The Project Gutenberg eBook of {title}</h2>\n"
+        "<p>This ebook is for the use of anyone anywhere in the United States and most other parts of the world.</p>\n"
+        f"<div id=\"pg-start-separator\"><span>*** START OF THE PROJECT GUTENBERG EBOOK {title.upper()} ***</span></div>\n"
+        "</section>\n"
+        f"<h1>{title}</h1>\n<p class=\"author\">par Auteur Anonyme</p>\n"
+        "<div class=\"toc\">\n" + "".join(f"<p><a href=\"#ch{i}\">Chapitre {to_roman(i)}</a></p>\n" for i in range(1, chapters + 1)) +
+        "</div>\n"
+    )
+    footer = (
+        "<section class=\"pg-boilerplate pgheader\" id=\"pg-footer\">\n"
+        f"<div id=\"pg-end-separator\"><span>*** END OF THE PROJECT GUTENBERG EBOOK {title.upper()} ***</span></div>\n"
+        + _paragraph(rng, 200) * 5 +
+        "</section>\n</body>\n</html>\n"
+    )
+    body_budget = max(0, target_bytes - len(header.encode("utf-8")) - len(footer.encode("utf-8")))
+    per_chapter = body_budget // chapters
+    parts = [header]
+    for ch in range(1, chapters + 1):
+        chunk = [f"<h2 id=\"ch{ch}\">Chapitre {to_roman(ch)}</h2>\n"]
+        size = len(chunk[0])
+        count = 0
+        while size < per_chapter:
+            count += 1
+            if images_every and count % images_every == 0:
+                piece = f"<p><img src=\"{image_uri}\" alt=\"illustration\" width=\"200\" height=\"120\"></p>\n"
+            else:
+                piece = _paragraph(rng)
+            chunk.append(piece)
+            size += len(piece.encode("utf-8"))
+        parts.append("".join(chunk))
+    parts.append(footer)
+    return "".join(parts)
+
+def make_source_pdf(path, pages, width=fitz.paper_size("a5")[0], height=fitz.paper_size("a5")[1], lines=30):
+    """PDF de `pages` pages de texte, A5 par défaut comme la sortie du serveur."""
+    doc = fitz.open()
+    for pno in range(pages):
+        page = doc.new_page(width=width, height=height)
+        page.insert_text((36, 40), f"Page {pno + 1}", fontsize=12)
+        for line in range(lines):
+            page.insert_text((36, 60 + line * 16), "Lorem ipsum dolor sit amet, consectetur adipiscing.", fontsize=9)
+    doc.save(path, deflate=True)
+    doc.close()
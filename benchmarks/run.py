@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+run.py
+Banc d'essai de bout en bout : nettoyage (clean_gutenberg_html), mise en page
+WeasyPrint (layout), sérialisation PDF (write) et imposition (booklet), sur
+des corpus synthétiques. Le corpus est généré et nettoyé à part, puis chaque
+étape tourne dans un processus neuf qui ne charge que son entrée. Le pic
+mémoire du processus (peak_rss_kb) inclut cette entrée, et pour write la mise
+en page qui la précède forcément ; les régressions mémoire sont donc jugées
+sur peak_rss_delta_kb, la croissance du pic pendant l'étape elle-même.
+Usage:
+    python benchmarks/run.py [--books 50k,1m,10m] [--booklets 100,500,2000]
+                             [--stages clean,render,booklet] [--repeat 3]
+                             [--output results.json] [--compare baseline.json]
+"""
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+import corpus
+
+STAGES = ("clean", "render", "booklet")
+
+def parse_size(text):
+    text = text.strip().lower()
+    units = {"k": 1000, "m": 1000 * 1000}
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def peak_rss_kb():
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def _timed(fn, repeat):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - started)
+    # Passe supplémentaire, hors chronométrage, pour le pic d'allocation Python
+    tracemalloc.start()
+    fn()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, runs, traced_peak
+
+def _record(stage, fixture, runs, traced_peak, rss_before, output_bytes, **extra):
+    entry = {
+        "stage": stage,
+        "fixture": fixture,
+        "seconds": min(runs),
+        "runs": runs,
+        "peak_rss_kb": peak_rss_kb(),
+        "peak_rss_delta_kb": max(0, peak_rss_kb() - rss_before),
+        "python_peak_bytes": traced_peak,
+        "output_bytes": output_bytes,
+    }
+    entry.update(extra)
+    return entry
+
+BOOK_TITLE = ("Livre synthétique", "Auteur")
+# Sous ce seuil, un écart de pic mémoire relève du bruit de mesure
+RSS_NOISE_KB = 1024
+
+def prepare_book(size, directory):
+    """Processus enfant : écrit dans `directory` un livre synthétique de `size` octets et sa version nettoyée."""
+    import server
+    html = corpus.make_gutenberg_html(size)
+    html_path = os.path.join(directory, "book.html")
+    cleaned_path = os.path.join(directory, "cleaned.html")
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    with open(cleaned_path, "w", encoding="utf-8") as f:
+        f.write(server.clean_gutenberg_html(html, *BOOK_TITLE))
+    return html_path, cleaned_path
+
+def measure_book_stage(stage, size, html_path, cleaned_path, repeat):
+    """Processus enfant : une seule étape (clean, layout ou write) sur le livre préparé par prepare_book."""
+    import server
+    fixture = f"book-{size}"
+    if stage == "clean":
+        with open(html_path, encoding="utf-8") as f:
+            html = f.read()
+        rss_before = peak_rss_kb()
+        cleaned, runs, traced = _timed(lambda: server.clean_gutenberg_html(html, *BOOK_TITLE), repeat)
+        return [_record("clean", fixture, runs, traced, rss_before, len(cleaned.encode("utf-8")),
+                        input_bytes=len(html.encode("utf-8")))]
+    from weasyprint import HTML
+    with open(cleaned_path, encoding="utf-8") as f:
+        cleaned = f.read()
+    stylesheet = server.get_stylesheet(server.DEFAULT_PROFILE)
+    def layout():
+        return HTML(string=cleaned).render(stylesheets=[stylesheet], font_config=server.FONT_CONFIG)
+    if stage == "layout":
+        rss_before = peak_rss_kb()
+        document, runs, traced = _timed(layout, repeat)
+        return [_record("layout", fixture, runs, traced, rss_before, 0, pages=len(document.pages))]
+    # L'écriture a besoin d'un document mis en page : cette mise en page, non
+    # chronométrée, fait partie de peak_rss_kb, pas de peak_rss_delta_kb
+    document = layout()
+    rss_before = peak_rss_kb()
+    pdf_bytes, runs, traced = _timed(document.write_pdf, repeat)
+    return [_record("write", fixture, runs, traced, rss_before, len(pdf_bytes), pages=len(document.pages))]
+
+def measure_booklet(pages, repeat):
+    """Processus enfant : imposition d'un PDF A5 synthétique de `pages` pages."""
+    import booklet
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.pdf")
+        corpus.make_source_pdf(source, pages)
+        with open(source, "rb") as f:
+            pdf_bytes = f.read()
+    rss_before = peak_rss_kb()
+    out, runs, traced = _timed(lambda: booklet.create_booklet(pdf_bytes, gb=True), repeat)
+    return [_record("booklet", f"booklet-{pages}p", runs, traced, rss_before, len(out),
+                    input_bytes=len(pdf_bytes))]
+
+def in_fresh_process(fn, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    versions = {}
+    for module in ("weasyprint", "fitz", "lxml"):
+        try:
+            mod = __import__(module)
+            versions[module] = getattr(mod, "__version__", None) or getattr(mod, "VersionBind", None)
+        except Exception:
+            versions[module] = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+def compare(results, baseline, threshold):
+    """Affiche les écarts avec un fichier de résultats précédent ; renvoie le nombre de régressions."""
+    previous = {(r["stage"], r["fixture"]): r for r in baseline["results"]}
+    regressions = 0
+    print(f"\n{'stage':<9}{'fixture':<18}{'before (s)':>12}{'after (s)':>12}{'ratio':>8}{'rss Δ ratio':>13}")
+    for r in results:
+        old = previous.get((r["stage"], r["fixture"]))
+        if old is None:
+            continue
+        ratio = r["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        # Mémoire ajoutée par l'étape elle-même, hors données d'entrée et étapes préalables
+        rss_ratio = (max(r["peak_rss_delta_kb"], RSS_NOISE_KB)
+                     / max(old.get("peak_rss_delta_kb", 0), RSS_NOISE_KB))
+        flag = ""
+        if ratio > 1 + threshold or rss_ratio > 1 + threshold:
+            regressions += 1
+            flag = "  <-- régression"
+        print(f"{r['stage']:<9}{r['fixture']:<18}{old['seconds']:>12.3f}{r['seconds']:>12.3f}{ratio:>8.2f}{rss_ratio:>13.2f}{flag}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks nettoyage / rendu / imposition.")
+    parser.add_argument("--books", default="50k,1m,10m", help="Tailles des livres HTML synthétiques. Default 50k,1m,10m")
+    parser.add_argument("--booklets", default="100,500,2000", help="Pages des PDF à imposer. Default 100,500,2000")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Étapes parmi {','.join(STAGES)}. Default toutes")
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions par mesure (meilleur temps retenu). Default 3")
+    parser.add_argument("--output", help="Fichier JSON de résultats.")
+    parser.add_argument("--compare", help="Fichier JSON d'un run précédent à comparer.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Écart relatif signalé comme régression. Default 0.10")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"Étapes inconnues : {', '.join(sorted(unknown))}")
+        sys.exit(2)
+    results = []
+    book_stages = (["clean"] if "clean" in stages else []) + (["layout", "write"] if "render" in stages else [])
+    if book_stages:
+        for size in (parse_size(s) for s in args.books.split(",") if s.strip()):
+            with tempfile.TemporaryDirectory() as tmp:
+                paths = in_fresh_process(prepare_book, size, tmp)
+                for stage in book_stages:
+                    results.extend(in_fresh_process(measure_book_stage, stage, size, *paths, args.repeat))
+    if "booklet" in stages:
+        for pages in (int(p) for p in args.booklets.split(",") if p.strip()):
+            results.extend(in_fresh_process(measure_booklet, pages, args.repeat))
+    print(f"{'stage':<9}{'fixture':<18}{'seconds':>10}{'peak rss (KB)':>15}{'rss Δ (KB)':>12}{'py peak (B)':>14}{'output (B)':>13}")
+    for r in results:
+        print(f"{r['stage']:<9}{r['fixture']:<18}{r['seconds']:>10.3f}{r['peak_rss_kb']:>15}{r['peak_rss_delta_kb']:>12}"
+              f"{r['python_peak_bytes']:>14}{r['output_bytes']:>13}")
+    report = {"meta": metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Résultats écrits dans {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -12,29 +12,44 @@ Options:
     --gutter MM gutter en mm (pliure). Default 0
     --pad blank|last padding du dernier carnet. Default blank
     --creep MM compensation creep en mm par feuille physique (0 = désactivé)
+    --jobs N nombre de processus pour imposer les carnets en parallèle. Default 1
+    --image-dpi N rééchantillonne les images au-delà de N dpi et les recompresse (0 = désactivé)
+    --image-quality Q qualité JPEG des images recompressées. Default 80
+    --low-memory écrit le livret par lots de carnets (mémoire bornée, gros volumes)
+    --flush-every N carnets par lot en mode --low-memory. Default 4
+    --imposition fold2|fold4|fold8|stack2|stack4|stack8|auto schéma d'imposition. Default fold2
+        (foldN : N pages par face, pliées ; stackN : coupe et empilage ; auto : moins de feuilles)
+    --sheet A4|A3|SRA3 format de feuille. Default A4
+    --layouts affiche feuilles, plis et coupes par exemplaire de chaque schéma, puis quitte
+    --dump-plan FILE écrit en JSON les plans d'imposition utilisés (inspection)
     --verbose logs verboses
 """
 from pathlib import Path
 import argparse
+import functools
+import json
+import os
+import shutil
 import sys
-import math
+import tempfile
 try:
     import fitz # PyMuPDF
 except Exception:
     print("PyMuPDF requis. Installer: pip install pymupdf")
     raise
+from imposition import (DEFAULT_LAYOUT, DEFAULT_SHEET, LAYOUTS, SHEET_FORMATS, choose_layout, pages_per_sheet,
+                         paper_usage, round_signature, sheet_size, signature_sheets)
+from optimize import DEFAULT_JPEG_QUALITY, SAVE_OPTIONS, optimize_pdf
 # Conversion mm -> points
 MM_TO_PT = 72.0 / 25.4
 def mm_to_pt(mm: float) -> float:
     return mm * MM_TO_PT
+# Mode --low-memory : carnets imposés entre deux écritures incrémentales
+LOW_MEMORY_FLUSH_SIGNATURES = 4
 # Papier portrait (points)
 A4_WIDTH_PT = 595.276
 A4_HEIGHT_PT = 841.89
 # ---------------- utilitaires ----------------
-def smallest_multiple_of_4_ge(n: int) -> int:
-    if n <= 0:
-        return 0
-    return ((n + 3) // 4) * 4
 def make_blank_page(width_pt, height_pt):
     tmp = fitz.open()
     tmp.new_page(width=width_pt, height=height_pt)
@@ -87,8 +102,47 @@ def fit_src_rect_into_target(target_rect: fitz.Rect, src_rect: fitz.Rect, scale_
     x1 = x0 + new_w
     y1 = y0 + new_h
     return fitz.Rect(x0, y0, x1, y1)
+class PagePlacer:
+    """
+    Pose les pages source sur les pages de sortie d'un même document.
+    Chaque page source n'est chargée et embarquée qu'une fois (XObject
+    partagé, réutilisé par PyMuPDF via son xref) ; la page blanche de
+    remplissage n'est jamais embarquée puisqu'elle ne dessine rien.
+    """
+    def __init__(self, blank_doc, scale_mode="fit", verbose=False):
+        self.blank_doc = blank_doc
+        self.scale_mode = scale_mode
+        self.verbose = verbose
+        self._src_rects = {}
+        self._placed_rects = {}
+        self.xrefs = {}
+        self.placements = 0
+    def source_rect(self, sdoc, spno):
+        key = (id(sdoc), spno)
+        rect = self._src_rects.get(key)
+        if rect is None:
+            rect = sdoc[spno].rect
+            self._src_rects[key] = rect
+        return rect
+    def place(self, out_page, target_rect, sdoc, spno, label="", rotate=0):
+        self.placements += 1
+        if sdoc is self.blank_doc:
+            return
+        try:
+            # target_rect : tuple (x0, y0, x1, y1) d'un ImpositionPlan ; le cadrage
+            # ne dépend que de la cible et du format source, calculé une fois
+            src_rect = self.source_rect(sdoc, spno)
+            key = (target_rect, src_rect.width, src_rect.height)
+            placed_rect = self._placed_rects.get(key)
+            if placed_rect is None:
+                placed_rect = fit_src_rect_into_target(fitz.Rect(target_rect), src_rect, scale_mode=self.scale_mode)
+                self._placed_rects[key] = placed_rect
+            self.xrefs[(id(sdoc), spno)] = out_page.show_pdf_page(placed_rect, sdoc, spno, rotate=rotate)
+        except Exception as e:
+            if self.verbose:
+                print(f"[!] Warning inserting {label}: {e}")
 # ---------------- imposition ----------------
-def split_into_booklets_minimize_last(pages, signature, blank_doc, pad_mode="blank"):
+def split_into_booklets_minimize_last(pages, signature, blank_doc, pad_mode="blank", unit=4):
     out = []
     total = len(pages)
     idx = 0
@@ -97,7 +151,7 @@ def split_into_booklets_minimize_last(pages, signature, blank_doc, pad_mode="bla
         idx += signature
     rem = total - idx
     if rem > 0:
-        last_sig = smallest_multiple_of_4_ge(rem)
+        last_sig = -(-rem // unit) * unit
         chunk = pages[idx: idx + rem]
         if pad_mode == "blank":
             for _ in range(last_sig - rem):
@@ -111,33 +165,291 @@ def split_into_booklets_minimize_last(pages, signature, blank_doc, pad_mode="bla
                 chunk.append((blank_doc, 0))
         out.append(chunk)
     return out
-def imposation_for_signature(signature):
-    if signature % 4 != 0:
-        raise ValueError("signature must be multiple of 4")
-    N = signature
-    sheets = []
-    sheets_count = N // 4
-    for i in range(sheets_count):
-        left_recto = N - 2 * i
-        right_recto = 1 + 2 * i
-        left_verso = 2 + 2 * i
-        right_verso = N - 1 - 2 * i
-        sheets.append((left_recto, right_recto, left_verso, right_verso))
-    return sheets
+def compute_cell_rects(layout, sheet_w, sheet_h, gutter_pt, margin_tlbr, overlap_pt=0.0):
+    """
+    Rectangles (x0, y0, x1, y1) des cellules d'une face de feuille, ligne par
+    ligne. Schémas pliés : les colonnes vont par paires de part et d'autre
+    d'une pliure de dos, chaque paire posée comme compute_embed_rects
+    (gouttière, recouvrement) sans déborder sur la paire voisine. Coupe et
+    empilage : grille simple. Les cellules sont vérifiées par
+    check_cells_disjoint.
+    """
+    top, leftm, bottom, rightm = margin_tlbr
+    inner_w = sheet_w - leftm - rightm
+    row_h = (sheet_h - top - bottom) / layout.rows
+    rects = []
+    for r in range(layout.rows):
+        y = top + r * row_h
+        if layout.folds:
+            pairs = layout.cols // 2
+            pair_w = inner_w / pairs
+            for k in range(pairs):
+                x = leftm + k * pair_w
+                left, right = compute_embed_rects(pair_w, row_h, gutter_pt, (0.0, 0.0, 0.0, 0.0), overlap_pt=overlap_pt)
+                # La gouttière écarte les pages du dos ; vers une paire voisine
+                # (pliure de tête ou de gouttière extérieure), elle reste dans la paire
+                left_x0 = left.x0 + x if k == 0 else max(left.x0 + x, x)
+                right_x1 = right.x1 + x if k == pairs - 1 else min(right.x1 + x, x + pair_w)
+                rects.append((left_x0, left.y0 + y, left.x1 + x, left.y1 + y))
+                rects.append((right.x0 + x, right.y0 + y, right_x1, right.y1 + y))
+        else:
+            cell_w = inner_w / layout.cols
+            for c in range(layout.cols):
+                rects.append((leftm + c * cell_w, y, leftm + (c + 1) * cell_w, y + row_h))
+    check_cells_disjoint(rects, overlap_pt)
+    return rects
+def check_cells_disjoint(rects, overlap_pt=0.0):
+    """ValueError si deux cellules d'une face empiètent l'une sur l'autre au-delà du recouvrement au dos."""
+    for i, a in enumerate(rects):
+        for b in rects[i + 1:]:
+            overlap_w = min(a[2], b[2]) - max(a[0], b[0])
+            overlap_h = min(a[3], b[3]) - max(a[1], b[1])
+            if overlap_w > overlap_pt + 1e-6 and overlap_h > 1e-6:
+                raise ValueError(f"Cellules superposées : {fitz.Rect(a)} et {fitz.Rect(b)}")
+class ImpositionPlan:
+    """
+    Table de placement précalculée d'un carnet de `signature` pages selon le
+    schéma `imposition` (imposition.LAYOUTS) : pour chaque page de sortie
+    (les deux faces de chaque feuille), les emplacements (indice 0-based de
+    la page dans le carnet, rectangle cible (x0, y0, x1, y1) creep compris,
+    rotation). Ne dépend que de la géométrie : un plan sert à tous les
+    carnets de même taille, et se sérialise en JSON.
+    """
+    def __init__(self, signature, page_size, pages, geometry=None, imposition=DEFAULT_LAYOUT):
+        self.signature = signature
+        self.imposition = imposition
+        self.page_size = tuple(page_size)
+        self.pages = pages
+        self.geometry = geometry or {}
+    @classmethod
+    def compute(cls, signature, imposition, sheet_w, sheet_h, gutter_pt, overlap_pt, creep_per_sheet_pt, margin_pts):
+        layout = LAYOUTS[imposition]
+        cells = compute_cell_rects(layout, sheet_w, sheet_h, gutter_pt, margin_pts, overlap_pt=overlap_pt)
+        sheets = signature_sheets(layout, signature)
+        sheets_count = len(sheets)
+        pages = []
+        for sheet_idx, sides in enumerate(sheets):
+            rects = cells
+            # compensation creep (feuilles emboîtées) : les feuilles extérieures s'écartent de la pliure
+            if layout.folds and creep_per_sheet_pt > 0 and sheets_count > 0:
+                shift_each_side = creep_per_sheet_pt * max(0, (sheets_count - 1 - sheet_idx)) / 2.0
+                rects = [(x0 + shift_each_side, y0, x1 + shift_each_side, y1) if i % 2 == 0 else
+                         (x0 - shift_each_side, y0, x1 - shift_each_side, y1)
+                         for i, (x0, y0, x1, y1) in enumerate(cells)]
+            for side in sides:
+                pages.append(tuple((page, rects[cell], rotate) for cell, page, rotate in side))
+        geometry = {
+            "gutter_pt": gutter_pt,
+            "overlap_pt": overlap_pt,
+            "creep_per_sheet_pt": creep_per_sheet_pt,
+            "margin_pts": list(margin_pts),
+        }
+        return cls(signature, (sheet_w, sheet_h), tuple(pages), geometry, imposition)
+    def to_dict(self):
+        return {
+            "signature": self.signature,
+            "imposition": self.imposition,
+            "page_size": list(self.page_size),
+            "geometry": self.geometry,
+            "pages": [[{"slot": slot, "rect": list(rect), "rotate": rotate} for slot, rect, rotate in page]
+                      for page in self.pages],
+        }
+    @classmethod
+    def from_dict(cls, data):
+        pages = tuple(tuple((entry["slot"], tuple(entry["rect"]), entry.get("rotate", 0)) for entry in page)
+                      for page in data["pages"])
+        return cls(data["signature"], data["page_size"], pages, data.get("geometry"),
+                   data.get("imposition", DEFAULT_LAYOUT))
+@functools.lru_cache(maxsize=64)
+def imposition_plan(signature, imposition, sheet_w, sheet_h, gutter_pt, overlap_pt, creep_per_sheet_pt, margin_pts):
+    """ImpositionPlan mis en cache par (signature, schéma, format, gouttière, recouvrement, creep, marges)."""
+    return ImpositionPlan.compute(signature, imposition, sheet_w, sheet_h, gutter_pt, overlap_pt, creep_per_sheet_pt,
+                                  tuple(margin_pts))
+def plan_for_layout(signature, layout):
+    # Plans chargés par load_plans (layout["plans"]) avant les plans calculés
+    plan = layout.get("plans", {}).get(signature)
+    if plan is not None:
+        return plan
+    return imposition_plan(signature, layout["imposition"], layout["sheet_w"], layout["sheet_h"], layout["gutter_pt"],
+                           layout["overlap_pt"], layout["creep_per_sheet_pt"], tuple(layout["margin_pts"]))
+def dump_plans(path, signatures, layout):
+    """Écrit en JSON les plans des tailles de carnet `signatures` (inspection, réutilisation par --load-plan)."""
+    plans = [plan_for_layout(sig, layout).to_dict() for sig in sorted(set(signatures))]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plans, f, indent=1)
+def load_plans(path, layout):
+    """
+    Relit un fichier de dump_plans (éventuellement retouché à la main) :
+    {signature: ImpositionPlan}, à placer dans layout["plans"]. Chaque plan
+    doit être du schéma et du format de `layout` et poser chaque page du
+    carnet une fois, sinon ValueError.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    plans = {}
+    for entry in data if isinstance(data, list) else [data]:
+        plan = ImpositionPlan.from_dict(entry)
+        if plan.imposition != layout["imposition"]:
+            raise ValueError(f"{path} : plan {plan.imposition}, imposition demandée {layout['imposition']}")
+        if any(abs(a - b) > 0.5 for a, b in zip(plan.page_size, (layout["sheet_w"], layout["sheet_h"]))):
+            raise ValueError(f"{path} : plan pour une feuille de {plan.page_size[0]:.1f} x {plan.page_size[1]:.1f} pts")
+        slots = sorted(slot for page in plan.pages for slot, _, _ in page)
+        if slots != list(range(plan.signature)):
+            raise ValueError(f"{path} : le plan de signature {plan.signature} ne pose pas chaque page une fois")
+        plans[plan.signature] = plan
+    return plans
 # ---------------- création du booklet ----------------
-def create_booklet_pdf(input_path, output_path, signature=16, gutter_mm=0.0,
-                       creep_mm: float = 0.0, book: bool = False, gb: bool = False,
-                       pad_mode="blank", verbose=False):
-    in_doc = fitz.open(input_path)
+SIDE_LABELS = ("recto", "verso")
+def impose_booklets(out_doc, booklets, placer, layout, verbose=False, first_index=1, total=None):
+    """
+    Impose les carnets `booklets` (listes d'entrées (doc, pno)) à la suite
+    dans `out_doc`. `layout` décrit la feuille (voir create_booklet_pdf) ;
+    la géométrie vient de l'ImpositionPlan de chaque taille de carnet, la
+    boucle ne fait plus que poser les pages.
+    """
+    sheet_w = layout["sheet_w"]
+    sheet_h = layout["sheet_h"]
+    total = total or len(booklets)
+    booklet_idx = first_index - 1
+    for booklet in booklets:
+        booklet_idx += 1
+        plan = plan_for_layout(len(booklet), layout)
+        if verbose:
+            print(f"[+] Processing booklet {booklet_idx}/{total} (signature={plan.signature}, {plan.imposition})")
+            for sheet_idx, slots in enumerate(plan.pages[::2]):
+                rects = " ".join(str(fitz.Rect(rect)) for _, rect, _ in slots)
+                print(f"[DEBUG] sheet_idx={sheet_idx} rects: {rects} (gutter_pt={layout['gutter_pt']:.3f} "
+                      f"overlap_pt={layout['overlap_pt']:.3f} creep_per_sheet_pt={layout['creep_per_sheet_pt']:.3f})")
+        for page_idx, slots in enumerate(plan.pages):
+            out_page = out_doc.new_page(width=sheet_w, height=sheet_h)
+            label = SIDE_LABELS[page_idx % 2]
+            for slot, rect, rotate in slots:
+                placer.place(out_page, rect, *booklet[slot], label=label, rotate=rotate)
+def open_source_pdf(source):
+    """Ouvre une source PDF donnée par chemin ou par bytes."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(source), filetype="pdf")
+    return fitz.open(source)
+def _impose_chunk(source, chunk, layout, first_index, total, verbose=False):
+    """
+    Worker --jobs : rouvre l'entrée (chemin ou bytes) en lecture seule et impose
+    une suite de carnets dont les entrées sont des numéros de page
+    (None = page blanche). Renvoie le PDF partiel en bytes.
+    """
+    in_doc = open_source_pdf(source)
+    blank_doc = make_blank_page(layout["portrait_w"], layout["portrait_h"])
+    out_doc = fitz.open()
+    try:
+        booklets = [[(blank_doc, 0) if pno is None else (in_doc, pno) for pno in booklet] for booklet in chunk]
+        placer = PagePlacer(blank_doc, scale_mode=layout["scale_mode"], verbose=verbose)
+        impose_booklets(out_doc, booklets, placer, layout, verbose=verbose, first_index=first_index, total=total)
+        return out_doc.tobytes()
+    finally:
+        out_doc.close()
+        in_doc.close()
+        blank_doc.close()
+def impose_booklets_parallel(out_doc, source, booklets, blank_doc, layout, jobs, verbose=False):
+    """
+    Impose les carnets dans un pool de `jobs` processus (carnets contigus par
+    worker) puis fusionne les documents partiels dans l'ordre.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    indexed = [[None if sdoc is blank_doc else spno for sdoc, spno in booklet] for booklet in booklets]
+    # Quelques lots par worker pour équilibrer la charge, en gardant l'ordre
+    n_chunks = min(len(indexed), jobs * 4)
+    bounds = [round(i * len(indexed) / n_chunks) for i in range(n_chunks + 1)]
+    chunks = [(bounds[i], indexed[bounds[i]:bounds[i + 1]]) for i in range(n_chunks)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_impose_chunk, source, chunk, layout, start + 1, len(indexed), verbose)
+                   for start, chunk in chunks]
+        for future in futures:
+            with fitz.open(stream=future.result(), filetype="pdf") as part:
+                out_doc.insert_pdf(part)
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus en Mo (None si indisponible)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Ko sous Linux, octets sous macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+def worker_source(source):
+    """Entrée à rouvrir ailleurs (worker, lot) : chemin ou bytes, jamais le document ouvert."""
+    if isinstance(source, fitz.Document):
+        return source.tobytes()
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    return str(source) if isinstance(source, Path) else source
+def impose_booklets_low_memory(out_path, source, booklets, blank_doc, layout, flush_every=LOW_MEMORY_FLUSH_SIGNATURES,
+                               verbose=False, image_dpi=0, image_quality=DEFAULT_JPEG_QUALITY):
+    """
+    Impose les carnets par lots de `flush_every` et les ajoute un à un au
+    fichier `out_path` (sauvegarde incrémentale). Chaque lot rouvre l'entrée
+    et part d'un document vide, puis tout est fermé et le cache MuPDF vidé :
+    la mémoire dépend de la taille d'un lot, pas de celle du livre. Les
+    polices partagées sont recopiées une fois par lot, d'où des lots de
+    plusieurs carnets. Renvoie les octets d'images gagnés (image_dpi > 0).
+    """
+    indexed = [[None if sdoc is blank_doc else spno for sdoc, spno in booklet] for booklet in booklets]
+    image_bytes_saved = 0
+    for start in range(0, len(indexed), flush_every):
+        part_bytes = _impose_chunk(source, indexed[start:start + flush_every], layout, start + 1, len(indexed), verbose)
+        with fitz.open(stream=part_bytes, filetype="pdf") as part:
+            del part_bytes
+            if image_dpi:
+                # Optimisation lot par lot : les images ne sont dédoublonnées qu'au sein d'un lot
+                image_bytes_saved += optimize_pdf(part, image_dpi, image_quality)
+            if start == 0:
+                with fitz.open() as out_doc:
+                    out_doc.insert_pdf(part)
+                    out_doc.save(out_path)
+            else:
+                with fitz.open(out_path) as out_doc:
+                    out_doc.insert_pdf(part)
+                    out_doc.saveIncr()
+        fitz.TOOLS.store_shrink(100)
+        done = min(start + flush_every, len(indexed))
+        if verbose:
+            print(f"[+] Carnets {start + 1}-{done}/{len(indexed)} écrits, pic RSS : {peak_rss_mb():.0f} Mo")
+    return image_bytes_saved
+def create_booklet(source, output=None, signature=16, gutter_mm=0.0,
+                   creep_mm: float = 0.0, book: bool = False, gb: bool = False,
+                   pad_mode="blank", verbose=False, jobs: int = 1, progress=None, stats=None,
+                   image_dpi: float = 0, image_quality: int = DEFAULT_JPEG_QUALITY, dump_plan=None,
+                   low_memory=False, flush_every: int = LOW_MEMORY_FLUSH_SIGNATURES,
+                   imposition: str = DEFAULT_LAYOUT, sheet: str = None, load_plan=None):
+    """
+    Impose `source` (chemin, bytes ou fitz.Document déjà ouvert) en livret.
+    `output` : chemin ou fichier binaire ouvert en écriture ; si None, le
+    livret est renvoyé en bytes sans passer par le disque.
+    `progress(étape, fraction)` est appelé au début de l'imposition et de
+    l'écriture ; `stats` (dict) reçoit le nombre de pages produites, le
+    schéma et le format retenus, les feuilles et plis par exemplaire.
+    `image_dpi` > 0 active l'optimisation (optimize.py) : images rééchantillonnées,
+    polices réduites aux glyphes utilisés, images identiques fusionnées.
+    `dump_plan` : chemin où écrire en JSON les plans d'imposition utilisés ;
+    `load_plan` : fichier de plans (même format) utilisés à la place des plans
+    calculés pour les tailles de carnet qu'il contient (load_plans).
+    `low_memory` : True, ou nombre de pages d'entrée à partir duquel le livret
+    est écrit par lots de `flush_every` carnets (impose_booklets_low_memory).
+    `imposition` : schéma d'imposition.LAYOUTS (fold2 = livret plié A4 par
+    défaut) ou "auto" pour le schéma et le format les plus économes en papier
+    (choose_layout) ; `sheet` : format de feuille (imposition.SHEET_FORMATS),
+    DEFAULT_SHEET si None ; avec "auto", le choix se limite à ce format s'il
+    est donné.
+    La signature est arrondie au multiple de pages par feuille du schéma.
+    """
+    owns_input = not isinstance(source, fitz.Document)
+    in_doc = open_source_pdf(source) if owns_input else source
     if in_doc.needs_pass:
         raise RuntimeError("Le PDF d'entrée est protégé / chiffré. Impossible de continuer.")
+    if not isinstance(low_memory, bool):
+        low_memory = bool(low_memory) and len(in_doc) >= low_memory
     portrait_w = A4_WIDTH_PT
     portrait_h = A4_HEIGHT_PT
-    landscape_w = portrait_h
-    landscape_h = portrait_w
     if verbose:
         print(f"[+] Input pages: {len(in_doc)}")
-        print(f"[+] Target paper: A4 (landscape {landscape_w:.1f} x {landscape_h:.1f} pts)")
     pages = [(in_doc, pno) for pno in range(len(in_doc))]
     blank_doc = make_blank_page(portrait_w, portrait_h)
     blank_page_entry = (blank_doc, 0)
@@ -164,9 +476,24 @@ def create_booklet_pdf(input_path, output_path, signature=16, gutter_mm=0.0,
         pages.insert(0, blank_page_entry)
         if verbose:
             print(f"[+] Ajout de 2 pages blanches au début (mode --gb). Nouveau total : {len(pages)} pages.")
+    if imposition == "auto":
+        best = choose_layout(len(pages), signature, sheets=(sheet,) if sheet else None)[0]
+        imposition, sheet = best["layout"], best["sheet"]
+    sheet = sheet or DEFAULT_SHEET
+    layout_def = LAYOUTS[imposition]
+    sheet_w, sheet_h = sheet_size(layout_def, sheet)
+    signature = round_signature(layout_def, signature)
+    usage = paper_usage(imposition, sheet, len(pages), signature)
+    if verbose:
+        print(f"[+] Target paper: {sheet} ({sheet_w:.1f} x {sheet_h:.1f} pts), imposition {imposition}, signature {signature}")
+        print(f"[+] Par exemplaire : {usage['sheets']} feuilles, {usage['folds']} plis, {usage['cuts']} coupes, "
+              f"{usage['blank_pages']} pages blanches ajoutées")
+    if stats is not None:
+        stats.update(imposition=imposition, sheet=sheet, sheets=usage["sheets"], folds=usage["folds"])
     scale_mode = "fill"
     overlap_mm = 0.2
-    booklets = split_into_booklets_minimize_last(pages, signature, blank_doc, pad_mode=pad_mode)
+    booklets = split_into_booklets_minimize_last(pages, signature, blank_doc, pad_mode=pad_mode,
+                                                 unit=pages_per_sheet(layout_def))
     if verbose:
         print(f"[+] Booklets à générer: {len(booklets)} sizes: {[len(b) for b in booklets]}")
     out_doc = fitz.open()
@@ -183,81 +510,133 @@ def create_booklet_pdf(input_path, output_path, signature=16, gutter_mm=0.0,
             print(f"[DEBUG] sample source rect: {sample_rect} (w={sample_rect.width:.2f} h={sample_rect.height:.2f})")
         except Exception:
             pass
-    booklet_idx = 0
-    for booklet in booklets:
-        booklet_idx += 1
-        sig_here = len(booklet)
+    layout = {
+        "portrait_w": portrait_w,
+        "portrait_h": portrait_h,
+        "imposition": imposition,
+        "sheet_w": sheet_w,
+        "sheet_h": sheet_h,
+        "gutter_pt": gutter_pt,
+        "overlap_pt": overlap_pt,
+        "creep_per_sheet_pt": creep_per_sheet_pt,
+        "margin_pts": margin_pts,
+        "scale_mode": scale_mode,
+    }
+    if load_plan:
+        layout["plans"] = load_plans(load_plan, layout)
+    if dump_plan:
+        dump_plans(dump_plan, [len(b) for b in booklets], layout)
+    placer = PagePlacer(blank_doc, scale_mode=scale_mode, verbose=verbose)
+    if progress:
+        progress("impose", 0.1)
+    if low_memory:
+        out_doc.close()
+        return _create_booklet_low_memory(source, in_doc, owns_input, output, booklets, blank_doc, layout,
+                                          flush_every, verbose, progress, stats, image_dpi, image_quality)
+    if jobs > 1 and len(booklets) > 1:
         if verbose:
-            print(f"[+] Processing booklet {booklet_idx}/{len(booklets)} (signature={sig_here})")
-        sheets_pattern = imposation_for_signature(sig_here)
-        sheets_count = sig_here // 4
-        for sheet_idx, sheet in enumerate(sheets_pattern):
-            lr, rr, lv, rv = sheet
-            lr_i = lr - 1
-            rr_i = rr - 1
-            lv_i = lv - 1
-            rv_i = rv - 1
-            rect_left, rect_right = compute_embed_rects(landscape_w, landscape_h, gutter_pt, margin_pts, overlap_pt=overlap_pt)
-            # apply creep compensation if enabled
-            if creep_per_sheet_pt > 0 and sheets_count > 0:
-                creep_for_sheet = creep_per_sheet_pt * max(0, (sheets_count - 1 - sheet_idx))
-                shift_each_side = creep_for_sheet / 2.0
-                rect_left = fitz.Rect(rect_left.x0 + shift_each_side, rect_left.y0, rect_left.x1 + shift_each_side, rect_left.y1)
-                rect_right = fitz.Rect(rect_right.x0 - shift_each_side, rect_right.y0, rect_right.x1 - shift_each_side, rect_right.y1)
-                if verbose:
-                    print(f"[DEBUG] sheet_idx={sheet_idx} creep_for_sheet_pt={creep_for_sheet:.3f} shift_each_side={shift_each_side:.3f}")
+            print(f"[+] Imposition parallèle : {jobs} processus")
+        impose_booklets_parallel(out_doc, worker_source(source), booklets, blank_doc, layout, jobs, verbose=verbose)
+    else:
+        impose_booklets(out_doc, booklets, placer, layout, verbose=verbose)
+    if verbose and placer.placements:
+        print(f"[+] Placements: {placer.placements}, pages source embarquées: {len(placer.xrefs)}")
+    # Les lots parallèles embarquent chacun leurs ressources : garbage=3 fusionne les doublons
+    save_options = {"garbage": 3 if jobs > 1 else 0}
+    if stats is not None:
+        stats["pages"] = len(out_doc)
+    try:
+        if image_dpi:
+            if progress:
+                progress("optimize", 0.8)
+            image_bytes_saved = optimize_pdf(out_doc, image_dpi, image_quality)
+            save_options = SAVE_OPTIONS
+            if stats is not None:
+                stats["image_bytes_saved"] = image_bytes_saved
             if verbose:
-                print(f"[DEBUG] rect_left: {rect_left}")
-                print(f"[DEBUG] rect_right: {rect_right} (gutter_mm={gutter_mm} overlap_mm={overlap_mm} creep_mm={creep_mm})")
-            # Recto
-            page_recto = out_doc.new_page(width=landscape_w, height=landscape_h)
-            # left recto
-            sdoc, spno = booklet[lr_i]
-            try:
-                src_rect = sdoc[spno].rect
-                target_rect = rect_left
-                placed_rect = fit_src_rect_into_target(target_rect, src_rect, scale_mode=scale_mode)
-                page_recto.show_pdf_page(placed_rect, sdoc, spno)
-            except Exception as e:
-                if verbose:
-                    print(f"[!] Warning inserting recto-left: {e}")
-            # right recto
-            sdoc, spno = booklet[rr_i]
-            try:
-                src_rect = sdoc[spno].rect
-                target_rect = rect_right
-                placed_rect = fit_src_rect_into_target(target_rect, src_rect, scale_mode=scale_mode)
-                page_recto.show_pdf_page(placed_rect, sdoc, spno)
-            except Exception as e:
-                if verbose:
-                    print(f"[!] Warning inserting recto-right: {e}")
-            # Verso
-            page_verso = out_doc.new_page(width=landscape_w, height=landscape_h)
-            sdoc, spno = booklet[lv_i]
-            try:
-                src_rect = sdoc[spno].rect
-                target_rect = rect_left
-                placed_rect = fit_src_rect_into_target(target_rect, src_rect, scale_mode=scale_mode)
-                page_verso.show_pdf_page(placed_rect, sdoc, spno)
-            except Exception as e:
-                if verbose:
-                    print(f"[!] Warning inserting verso-left: {e}")
-            sdoc, spno = booklet[rv_i]
-            try:
-                src_rect = sdoc[spno].rect
-                target_rect = rect_right
-                placed_rect = fit_src_rect_into_target(target_rect, src_rect, scale_mode=scale_mode)
-                page_verso.show_pdf_page(placed_rect, sdoc, spno)
-            except Exception as e:
-                if verbose:
-                    print(f"[!] Warning inserting verso-right: {e}")
-    out_doc.save(output_path)
-    out_doc.close()
-    in_doc.close()
-    blank_doc.close()
+                print(f"[+] Optimisation des images ({image_dpi:g} dpi) : {image_bytes_saved / 1024:.0f} Ko gagnés")
+        if progress:
+            progress("save", 0.9)
+        if output is None:
+            return out_doc.tobytes(**save_options)
+        out_doc.save(output, **save_options)
+    finally:
+        out_doc.close()
+        if owns_input:
+            in_doc.close()
+        blank_doc.close()
+    if verbose and isinstance(output, (str, Path)):
+        print(f"[+] Booklet saved to: {output}")
     if verbose:
-        print(f"[+] Booklet saved to: {output_path}")
+        print(f"[+] Pic RSS : {peak_rss_mb():.0f} Mo")
+    return None
+def _create_booklet_low_memory(source, in_doc, owns_input, output, booklets, blank_doc, layout,
+                               flush_every, verbose, progress, stats, image_dpi, image_quality):
+    """Suite de create_booklet en mode low_memory : même contrat de retour."""
+    if verbose:
+        print(f"[+] Mode mémoire réduite : écriture par lots de {flush_every} carnets")
+    tmp_path = None
+    if isinstance(output, (str, Path)):
+        out_path = str(output)
+    else:
+        # Sortie en bytes ou fichier ouvert : le livret passe par un fichier temporaire
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        out_path = tmp_path
+    try:
+        # L'entrée est rouverte lot par lot : le document du parent ne sert plus
+        src = worker_source(source)
+        if owns_input:
+            in_doc.close()
+        image_bytes_saved = impose_booklets_low_memory(out_path, src, booklets, blank_doc, layout, flush_every,
+                                                       verbose=verbose, image_dpi=image_dpi, image_quality=image_quality)
+        if stats is not None:
+            stats["pages"] = sum(len(plan_for_layout(len(booklet), layout).pages) for booklet in booklets)
+            if image_dpi:
+                stats["image_bytes_saved"] = image_bytes_saved
+        if progress:
+            progress("save", 0.9)
+        if tmp_path is not None:
+            with open(tmp_path, "rb") as f:
+                if output is None:
+                    return f.read()
+                shutil.copyfileobj(f, output)
+    finally:
+        blank_doc.close()
+        if tmp_path is not None:
+            os.remove(tmp_path)
+    if verbose:
+        if isinstance(output, (str, Path)):
+            print(f"[+] Booklet saved to: {output}")
+        print(f"[+] Pic RSS : {peak_rss_mb():.0f} Mo")
+    return None
+def create_booklet_pdf(input_path, output_path, signature=16, gutter_mm=0.0,
+                       creep_mm: float = 0.0, book: bool = False, gb: bool = False,
+                       pad_mode="blank", verbose=False, jobs: int = 1, image_dpi: float = 0,
+                       image_quality: int = DEFAULT_JPEG_QUALITY, dump_plan=None, low_memory=False,
+                       flush_every: int = LOW_MEMORY_FLUSH_SIGNATURES, imposition: str = DEFAULT_LAYOUT,
+                       sheet: str = None, load_plan=None):
+    create_booklet(input_path, output_path, signature=signature, gutter_mm=gutter_mm, creep_mm=creep_mm,
+                   book=book, gb=gb, pad_mode=pad_mode, verbose=verbose, jobs=jobs,
+                   image_dpi=image_dpi, image_quality=image_quality, dump_plan=dump_plan,
+                   low_memory=low_memory, flush_every=flush_every, imposition=imposition, sheet=sheet,
+                   load_plan=load_plan)
 # ---------------- CLI ----------------
+def print_layouts(input_path, signature, book=False, gb=False):
+    """Tableau des schémas produisant au moins des pages A5, du plus économe au moins économe."""
+    with fitz.open(input_path) as doc:
+        page_count = len(doc)
+    # Mêmes ajouts de pages blanches que create_booklet
+    if book:
+        page_count = (page_count - 2 if page_count >= 2 else page_count) + 4
+    elif gb:
+        page_count += 2
+    print(f"{page_count} pages, signature {signature}")
+    print(f"{'schéma':<8} {'feuille':<6} {'page (mm)':<13} {'feuilles':>8} {'plis':>6} {'coupes':>6} {'blanches':>8}")
+    for usage in choose_layout(page_count, signature):
+        width_mm, height_mm = usage["page_mm"]
+        print(f"{usage['layout']:<8} {usage['sheet']:<6} {f'{width_mm:g} x {height_mm:g}':<13} {usage['sheets']:>8} "
+              f"{usage['folds']:>6} {usage['cuts']:>6} {usage['blank_pages']:>8}")
 def parse_args():
     parser = argparse.ArgumentParser(description="Générer un livret (booklet) prêt à imprimer.")
     parser.add_argument("input", help="PDF d'entrée (source A4 attendu).")
@@ -268,10 +647,23 @@ def parse_args():
     parser.add_argument("--gutter", type=float, default=0.0, help="Gutter (pliure) en mm. Default 0")
     parser.add_argument("--pad", type=str, default="blank", choices=["blank", "last"], help="Padding du dernier carnet. Default blank")
     parser.add_argument("--creep", type=float, default=0.0, help="Compensation creep en mm par feuille physique (0 = désactivé).")
+    parser.add_argument("--jobs", type=int, default=1, help="Processus pour imposer les carnets en parallèle. Default 1")
+    parser.add_argument("--image-dpi", type=float, default=0, help="Rééchantillonner les images au-delà de ce dpi (0 = désactivé). Default 0")
+    parser.add_argument("--image-quality", type=int, default=DEFAULT_JPEG_QUALITY, help=f"Qualité JPEG des images recompressées. Default {DEFAULT_JPEG_QUALITY}")
+    parser.add_argument("--low-memory", action="store_true", help="Écrire le livret par lots de carnets (mémoire bornée).")
+    parser.add_argument("--flush-every", type=int, default=LOW_MEMORY_FLUSH_SIGNATURES, help=f"Carnets par lot en mode --low-memory. Default {LOW_MEMORY_FLUSH_SIGNATURES}")
+    parser.add_argument("--imposition", default=DEFAULT_LAYOUT, choices=sorted(LAYOUTS) + ["auto"], help=f"Schéma d'imposition. Default {DEFAULT_LAYOUT}")
+    parser.add_argument("--sheet", choices=sorted(SHEET_FORMATS), help=f"Format de feuille. Default {DEFAULT_SHEET} (avec --imposition auto : le plus économe)")
+    parser.add_argument("--layouts", action="store_true", help="Comparer les schémas (feuilles, plis, coupes par exemplaire) et quitter.")
+    parser.add_argument("--dump-plan", metavar="FILE", help="Écrire en JSON les plans d'imposition utilisés.")
+    parser.add_argument("--load-plan", metavar="FILE", help="Utiliser les plans d'un fichier --dump-plan (retouchés ou non).")
     parser.add_argument("--verbose", action="store_true", help="Verbose output")
     return parser.parse_args()
 if __name__ == "__main__":
     args = parse_args()
+    if args.layouts:
+        print_layouts(args.input, args.signature, book=args.book, gb=args.gb)
+        sys.exit(0)
     if not (args.book or args.gb):
         print("Une des options --book ou --gb est obligatoire.")
         sys.exit(2)
@@ -282,6 +674,9 @@ if __name__ == "__main__":
     if args.signature % 4 != 0:
         print("La signature doit être multiple de 4.")
         sys.exit(2)
+    if args.flush_every < 1:
+        print("--flush-every doit être au moins 1.")
+        sys.exit(2)
     if args.verbose:
         print(f"[+] input_path = {args.input}")
         print(f"[+] output_path = {outp}")
@@ -295,7 +690,16 @@ if __name__ == "__main__":
             book=args.book,
             gb=args.gb,
             pad_mode=args.pad,
-            verbose=args.verbose
+            verbose=args.verbose,
+            jobs=args.jobs,
+            image_dpi=args.image_dpi,
+            image_quality=args.image_quality,
+            dump_plan=args.dump_plan,
+            low_memory=args.low_memory,
+            flush_every=args.flush_every,
+            imposition=args.imposition,
+            sheet=args.sheet,
+            load_plan=args.load_plan
         )
     except Exception as exc:
         print("Erreur lors de la génération du booklet :", exc)
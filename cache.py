@@ -0,0 +1,282 @@
+"""
+cache.py
+Two-tier content-addressed byte cache (memory LRU + disk) used by the server
+to avoid re-rendering identical conversions.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def content_key(*parts):
+    """Stable sha256 key over an ordered sequence of str/bytes/None parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            data = b''
+        elif isinstance(part, bytes):
+            data = part
+        else:
+            data = str(part).encode('utf-8')
+        # Length prefix so ("ab", "c") and ("a", "bc") never collide
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+
+class TieredCache:
+    """
+    In-memory LRU tier bounded by `max_memory_bytes`, backed by an optional
+    on-disk tier in `directory` bounded by `max_disk_bytes` (least recently
+    used files are removed first). Values are raw bytes; values larger than
+    `max_memory_entry_bytes` only live on disk.
+
+    Several processes (gunicorn workers) may share `directory`: a key missing
+    from the local index is looked up on disk, hits touch the file's mtime,
+    and the index is rebuilt from the directory before each write enforces
+    `max_disk_bytes`, so the limit and the LRU order hold for all of them.
+    """
+
+    def __init__(self, max_memory_bytes, directory=None, max_disk_bytes=0, suffix='.bin',
+                 max_memory_entry_bytes=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_memory_entry_bytes = max_memory_bytes if max_memory_entry_bytes is None else max_memory_entry_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes if directory else 0
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> size on disk
+        self._disk_bytes = 0
+        self._costs = {}  # key -> seconds it took to produce the value
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+        if self.max_disk_bytes > 0:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+
+    # ---------------- disk index ----------------
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _scan_disk(self):
+        # (mtime, key, size) of every cached file, least recently used first; without the lock
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len(self.suffix)], st.st_size))
+        return sorted(entries)
+
+    def _set_disk_index(self, entries):
+        # Called with self._lock held
+        self._disk = OrderedDict((key, size) for _, key, size in entries)
+        self._disk_bytes = sum(self._disk.values())
+        self._evict_disk()
+
+    def _load_disk_index(self):
+        self._set_disk_index(self._scan_disk())
+
+    def _find_disk(self, key):
+        # True if `key` is on disk, written by another process sharing the directory if need be
+        with self._lock:
+            if key in self._disk:
+                return True
+        try:
+            size = os.path.getsize(self._path(key))
+        except OSError:
+            return False
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = size
+                self._disk_bytes += size
+        return True
+
+    def _touch(self, key):
+        # The mtime is the LRU order seen by the other processes
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions += 1
+            if key not in self._memory:
+                self._costs.pop(key, None)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _write_tmp(self, data=None, src=None):
+        # Either `data` bytes or a readable binary file `src`, written to a temp file
+        # without holding the lock. Returns (tmp_path, size) or None.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if src is not None:
+                    shutil.copyfileobj(src, f)
+                else:
+                    f.write(data)
+                return tmp_path, f.tell()
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+    def _commit_disk(self, key, tmp_path, size):
+        # Called with self._lock held: atomic rename and index update only
+        try:
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+        old = self._disk.pop(key, 0)
+        self._disk[key] = size
+        self._disk_bytes += size - old
+        self._evict_disk()
+        return self._path(key) if key in self._disk else None
+
+    def _write_disk(self, key, data=None, src=None):
+        written = self._write_tmp(data, src)
+        if written is None:
+            return None
+        # Other processes write to and evict from the directory too
+        entries = self._scan_disk()
+        with self._lock:
+            self._set_disk_index(entries)
+            return self._commit_disk(key, *written)
+
+    # ---------------- memory tier ----------------
+    def _store_memory(self, key, data):
+        if len(data) > min(self.max_memory_bytes, self.max_memory_entry_bytes):
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+            if evicted_key not in self._disk:
+                self._costs.pop(evicted_key, None)
+
+    # ---------------- API ----------------
+    def get_memory(self, key):
+        """Value of `key` in the memory tier, counted as a hit, or None without counting a miss."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.seconds_saved += self._costs.get(key, 0.0)
+            return data
+
+    def get(self, key):
+        data = self.get_memory(key)
+        if data is not None:
+            return data
+        if self.max_disk_bytes > 0 and self._find_disk(key):
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            with self._lock:
+                if data is None:
+                    size = self._disk.pop(key, None)
+                    if size is not None:
+                        self._disk_bytes -= size
+                else:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self._store_memory(key, data)
+                    self.disk_hits += 1
+                    self.seconds_saved += self._costs.get(key, 0.0)
+            if data is not None:
+                self._touch(key)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data, cost=0.0):
+        with self._lock:
+            self._costs[key] = cost
+            self._store_memory(key, data)
+        if self.max_disk_bytes > 0 and len(data) <= self.max_disk_bytes:
+            self._write_disk(key, data)
+
+    def get_path(self, key):
+        """
+        Path of the disk-tier file for `key`, counted as a hit, or None without
+        counting a miss. Lets callers stream the file instead of loading it.
+        """
+        if self.max_disk_bytes <= 0 or not self._find_disk(key):
+            return None
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+            self.disk_hits += 1
+            self.seconds_saved += self._costs.get(key, 0.0)
+        self._touch(key)
+        return self._path(key)
+
+    def put_file(self, key, src, cost=0.0):
+        """
+        Store the content of the seekable binary file `src`, copied in chunks.
+        Returns the disk-tier path of the stored value, or None.
+        """
+        src.seek(0, os.SEEK_END)
+        size = src.tell()
+        src.seek(0)
+        data = src.read() if size <= min(self.max_memory_bytes, self.max_memory_entry_bytes) else None
+        src.seek(0)
+        with self._lock:
+            self._costs[key] = cost
+            if data is not None:
+                self._store_memory(key, data)
+        if self.max_disk_bytes > 0 and size <= self.max_disk_bytes:
+            return self._write_disk(key, src=src)
+        return None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+            }
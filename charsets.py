@@ -0,0 +1,62 @@
+"""
+charsets.py
+Character encoding of HTML documents received as bytes. Project Gutenberg
+files are often ISO-8859-1 and say so in a <meta> (or XML) declaration;
+bytes are decoded with that declaration, or a byte order mark, and only
+fall back to UTF-8 when nothing is declared.
+"""
+import codecs
+import re
+
+# Declarations are expected in the <head>, near the start of the file
+SNIFF_BYTES = 4096
+
+_BOMS = ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+_META_CHARSET_RE = re.compile(rb'<meta\s[^>]*?charset\s*=\s*["\']?\s*([A-Za-z0-9._:-]+)', re.IGNORECASE)
+_XML_ENCODING_RE = re.compile(rb'^\s*<\?xml\s[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._:-]+)', re.IGNORECASE)
+# Declarations rewritten by to_utf8
+_DECLARATION_RE = re.compile(
+    r'(<meta\s[^>]*?charset\s*=\s*["\']?\s*|<\?xml\s[^>]*?encoding\s*=\s*["\'])[A-Za-z0-9._:-]+', re.IGNORECASE)
+# Like browsers: documents labelled Latin-1 are decoded as its windows-1252 superset
+_LATIN1 = ('latin-1', 'iso8859-1')
+
+
+def normalize_charset(label):
+    """Python codec name for a charset label, or None when it is unknown."""
+    try:
+        name = codecs.lookup(label.strip()).name
+    except (LookupError, ValueError):
+        return None
+    return 'cp1252' if name in _LATIN1 else name
+
+
+def declared_charset(raw):
+    """Encoding announced by a byte order mark or a declaration at the start of `raw`, or None."""
+    for bom, name in _BOMS:
+        if raw.startswith(bom):
+            return name
+    head = raw[:SNIFF_BYTES]
+    match = _META_CHARSET_RE.search(head) or _XML_ENCODING_RE.search(head)
+    if not match:
+        return None
+    name = normalize_charset(match.group(1).decode('ascii'))
+    # A UTF-16 document cannot declare itself in ASCII bytes: the label is wrong
+    return None if name and name.startswith('utf-16') else name
+
+
+def is_utf8(name):
+    return name is None or name in ('utf-8', 'utf-8-sig')
+
+
+def to_utf8(raw):
+    """
+    (UTF-8 bytes, source encoding) for the HTML document `raw`. A document
+    in another declared encoding is decoded and re-encoded, its declaration
+    rewritten to utf-8 so that it still describes the bytes.
+    """
+    encoding = declared_charset(raw)
+    if is_utf8(encoding):
+        return raw, 'utf-8'
+    text = raw.decode(encoding, errors='replace')
+    head = _DECLARATION_RE.sub(r'\1utf-8', text[:SNIFF_BYTES])
+    return (head + text[SNIFF_BYTES:]).encode('utf-8'), encoding
@@ -1,14 +1,21 @@
+import argparse
+import collections
+import functools
+import json
+import os
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from weasyprint import HTML
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python3 convert.py <input_file.html> <output_file.pdf>")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+# Batch mode: output name -> content key of the last successful render
+INDEX_FILE = '.convert-index.json'
+# The index is rewritten after this many completed books (and at the end)
+INDEX_FLUSH_EVERY = 50
 
+def convert_one(input_file, output_file):
+    # Plain WeasyPrint conversion, no Gutenberg cleaning
     try:
         html = HTML(input_file)
         html.write_pdf(output_file)
@@ -17,5 +24,181 @@ def main():
         print(f"An error occurred: {e}")
         sys.exit(1)
 
+def find_books(source):
+    # Returns [(input path, output name, title, author)]
+    if os.path.isdir(source):
+        books = []
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(('.html', '.htm')):
+                    path = os.path.join(dirpath, name)
+                    output = os.path.splitext(os.path.relpath(path, source))[0] + '.pdf'
+                    books.append((path, output, None, None))
+        return books
+
+    # Manifest: one book per line, "path[<TAB>title[<TAB>author]]", # for comments.
+    # Relative paths are resolved against the manifest's directory.
+    base = os.path.dirname(os.path.abspath(source))
+    books = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            fields = line.split('\t')
+            path = os.path.join(base, fields[0].strip())
+            title = fields[1].strip() if len(fields) > 1 and fields[1].strip() else None
+            author = fields[2].strip() if len(fields) > 2 and fields[2].strip() else None
+            output = os.path.splitext(os.path.basename(path))[0] + '.pdf'
+            books.append((path, output, title, author))
+    return books
+
+def load_index(out_dir):
+    try:
+        with open(os.path.join(out_dir, INDEX_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(out_dir, index):
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=0, sort_keys=True)
+    os.replace(tmp_path, os.path.join(out_dir, INDEX_FILE))
+
+def render_book(input_path, output_path, title, author, profile):
+    # Runs in a worker process: same clean + render path as /api/convert
+    from server import render_pdf
+    started = time.perf_counter()
+    with open(input_path, 'rb') as f:
+        html_content = f.read()
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    # Written next to the target and renamed, so an interrupted run never leaves a truncated PDF
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or '.', suffix='.tmp')
+    stats = {}
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            render_pdf(html_content, title, author, profile=profile, target=f, stats=stats)
+            size = f.tell()
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return stats.get('pages', 0), size, time.perf_counter() - started
+
+def convert_batch(source, out_dir, jobs=None, profile=None, force=False):
+    # Every book is cleaned once: no point keeping cleaned bodies in the workers
+    os.environ.setdefault('CLEAN_CACHE_MEMORY_MB', '0')
+    # Server code is imported once here; forked workers inherit the loaded WeasyPrint
+    from cache import content_key
+    from server import DEFAULT_PROFILE, PAGE_PROFILES, stylesheet_version
+    profile = profile or DEFAULT_PROFILE
+    if profile not in PAGE_PROFILES:
+        print(f"Unknown profile '{profile}', expected one of {sorted(PAGE_PROFILES)}")
+        return 2
+
+    books = find_books(source)
+    counts = collections.Counter(output for _, output, _, _ in books)
+    duplicates = sorted(output for output, count in counts.items() if count > 1)
+    if duplicates:
+        print(f"Several inputs map to the same output: {', '.join(duplicates)}")
+        return 2
+    os.makedirs(out_dir, exist_ok=True)
+    index = load_index(out_dir)
+
+    # Up-to-date check: hash of the HTML, title, author and stylesheet, like the server cache
+    version = stylesheet_version(profile)
+    todo = []
+    skipped = 0
+    input_bytes = 0
+    for path, output, title, author in books:
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = content_key(data, title, author, version, 'standard')
+        if not force and index.get(output) == key and os.path.exists(os.path.join(out_dir, output)):
+            skipped += 1
+            continue
+        input_bytes += len(data)
+        todo.append((path, output, title, author, key))
+
+    print(f"{len(books)} books, {skipped} up to date, {len(todo)} to convert")
+    started = time.perf_counter()
+    done = failed = pages = output_bytes = 0
+    workers = min(jobs or os.cpu_count() or 1, len(todo))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        # (book, callable returning (pages, bytes, seconds)) in completion order
+        if pool:
+            futures = {
+                pool.submit(render_book, path, os.path.join(out_dir, output), title, author, profile):
+                    (path, output, key)
+                for path, output, title, author, key in todo
+            }
+            results = ((futures[future], future.result) for future in as_completed(futures))
+        else:
+            results = (((path, output, key),
+                        functools.partial(render_book, path, os.path.join(out_dir, output), title, author, profile))
+                       for path, output, title, author, key in todo)
+
+        for (path, output, key), result in results:
+            try:
+                book_pages, size, seconds = result()
+            except Exception as e:
+                failed += 1
+                index.pop(output, None)
+                print(f"[!] {path}: {e}")
+                continue
+            done += 1
+            pages += book_pages
+            output_bytes += size
+            index[output] = key
+            print(f"[{done + failed}/{len(todo)}] {output}: {book_pages} pages, {size / 1024:.0f} KB in {seconds:.2f}s")
+            if done % INDEX_FLUSH_EVERY == 0:
+                save_index(out_dir, index)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        save_index(out_dir, index)
+
+    elapsed = time.perf_counter() - started
+    print(f"\nConverted {done}, skipped {skipped}, failed {failed} in {elapsed:.1f}s")
+    if done and elapsed > 0:
+        print(f"Throughput: {done / elapsed * 60:.1f} books/min, {pages / elapsed:.1f} pages/s, "
+              f"{input_bytes / elapsed / 1e6:.2f} MB/s of HTML in, {output_bytes / 1e6:.1f} MB of PDF out")
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert HTML to PDF. With --batch, run a directory or manifest of Gutenberg books "
+                    "through the server's clean + render path.",
+        usage="python3 convert.py <input_file.html> <output_file.pdf>\n"
+              "       python3 convert.py --batch <dir|manifest.txt> --out-dir <dir> [--jobs N] [--profile a5] [--force]",
+    )
+    parser.add_argument('files', nargs='*', help=argparse.SUPPRESS)
+    parser.add_argument('--batch', metavar='SOURCE',
+                        help="Directory of .html files (searched recursively) or manifest, one "
+                             "'path[<TAB>title[<TAB>author]]' per line.")
+    parser.add_argument('--out-dir', help="Output directory for --batch; the input tree is mirrored.")
+    parser.add_argument('--jobs', type=int, default=None, help="Worker processes. Default: number of CPUs")
+    parser.add_argument('--profile', default=None, help="Page profile (a5, a4, large-print). Default a5")
+    parser.add_argument('--force', action='store_true', help="Re-render books that are already up to date.")
+    args = parser.parse_args()
+
+    if args.batch:
+        if args.files or not args.out_dir:
+            parser.error("--batch takes --out-dir and no positional files")
+        if args.jobs is not None and args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        sys.exit(convert_batch(args.batch, args.out_dir, jobs=args.jobs, profile=args.profile, force=args.force))
+
+    if len(args.files) != 2:
+        print("Usage: python3 convert.py <input_file.html> <output_file.pdf>")
+        sys.exit(1)
+    convert_one(args.files[0], args.files[1])
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,79 @@
+"""
+gunicorn.conf.py
+Production entry point, read by `gunicorn server:app` from this directory.
+The parent imports server.py (preload_app) and warms it up once, so every
+forked worker starts with WeasyPrint, fonts and stylesheets already loaded.
+A worker is recycled after WORKER_MAX_RENDERS renders or once its RSS passes
+WORKER_MAX_RSS_MB; it finishes the current request first.
+The job and shard process pools of server.py are replaced after as many
+renders per process.
+"""
+import os
+import resource
+import sys
+import time
+
+STARTED = time.time()
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_CONCURRENCY', '0')) or os.cpu_count() or 1
+# Every worker has its own job and shard process pools: by default they share
+# the CPUs instead of each sizing them to cpu_count (read by server.py on preload)
+for pool_size_var in ('RENDER_WORKERS', 'SHARD_WORKERS'):
+    os.environ.setdefault(pool_size_var, str(max(1, (os.cpu_count() or 1) // workers)))
+preload_app = True
+# A large book takes minutes to lay out; deploys wait for running renders too
+timeout = int(os.environ.get('WORKER_TIMEOUT', '300'))
+graceful_timeout = timeout
+# Backstop for every kind of request, jittered so workers do not restart together
+max_requests = int(os.environ.get('WORKER_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+# Requests that lay out or impose a PDF in the worker itself
+RENDER_PATHS = ('/api/convert', '/api/booklet')
+MAX_RENDERS = int(os.environ.get('WORKER_MAX_RENDERS', '200'))
+MAX_RSS_MB = int(os.environ.get('WORKER_MAX_RSS_MB', '1024'))
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        # No procfs: the peak is the best available approximation (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def when_ready(server):
+    import server as app_module
+    warm_up_seconds = app_module.warm_up()
+    server.log.info("Warm-up %.2fs, ready %.2fs after start", warm_up_seconds, time.time() - STARTED)
+
+
+def post_fork(server, worker):
+    worker.forked = time.time()
+    worker.renders = 0
+
+
+def pre_request(worker, req):
+    worker.request_started = time.time()
+
+
+def post_request(worker, req, environ, resp):
+    if req.method != 'POST' or req.path not in RENDER_PATHS:
+        return
+    worker.renders += 1
+    if worker.renders == 1:
+        # Time-to-first-render of a warm worker: the request itself, and since fork / start
+        now = time.time()
+        worker.log.info("Worker %s: first render took %.2fs, done %.2fs after fork, %.2fs after start",
+                        worker.pid, now - worker.request_started, now - worker.forked, now - STARTED)
+    rss_mb = current_rss_mb()
+    if worker.renders < MAX_RENDERS and rss_mb < MAX_RSS_MB:
+        return
+    import server as app_module
+    if app_module.RENDER_JOBS.pending():
+        return  # background jobs live in this worker: recycle after they finish
+    worker.log.info("Recycling worker %s after %d renders, RSS %.0f MB", worker.pid, worker.renders, rss_mb)
+    worker.alive = False
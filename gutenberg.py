@@ -0,0 +1,248 @@
+"""
+gutenberg.py
+Server-side access to Project Gutenberg books by id. A source fetches the
+HTML of a book (a local mirror directory or HTTP with pooled keep-alive
+connections) and BookStore keeps every fetched book in a persistent
+on-disk store with a JSON index, so a book leaves the network only once.
+"""
+import fcntl
+import hashlib
+import http.client
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from charsets import to_utf8
+
+
+class BookNotFound(Exception):
+    pass
+
+
+class SourceError(Exception):
+    pass
+
+
+class MirrorSource:
+    """Books read from a local copy of the Gutenberg tree (deployments, tests)."""
+
+    # Tried in order, relative to the mirror directory
+    PATTERNS = (
+        'cache/epub/{id}/pg{id}-images.html',
+        'cache/epub/{id}/pg{id}.html',
+        '{id}/pg{id}-images.html',
+        '{id}/{id}-h/{id}-h.htm',
+        '{id}.html',
+    )
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, book_id):
+        for pattern in self.PATTERNS:
+            path = os.path.join(self.directory, pattern.format(id=book_id))
+            try:
+                with open(path, 'rb') as f:
+                    return f.read(), path
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                raise SourceError(f"{path}: {e}") from e
+        raise BookNotFound(book_id)
+
+
+class _ConnectionPool:
+    # Keep-alive connections to one host, reused across requests and threads
+    def __init__(self, scheme, host, port, maxsize, timeout):
+        self.connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize)
+
+    def request(self, path, headers):
+        # Returns (status, headers, body); a stale pooled connection is retried once on a new one
+        for attempt in (0, 1):
+            try:
+                conn = self._idle.get_nowait() if attempt == 0 else None
+            except queue.Empty:
+                conn = None
+            conn = conn or self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            return response.status, response.headers, body
+
+
+class HttpSource:
+    """Books downloaded from a Gutenberg site or mirror over HTTP(S)."""
+
+    PATHS = (
+        '/cache/epub/{id}/pg{id}-images.html',
+        '/ebooks/{id}.html.images',
+    )
+    MAX_REDIRECTS = 5
+
+    def __init__(self, base_url='https://www.gutenberg.org', timeout=30, pool_size=4):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = _ConnectionPool(
+                    parts.scheme, parts.hostname, parts.port, self.pool_size, self.timeout)
+            return pool
+
+    def _get(self, url):
+        for _ in range(self.MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path + ('?' + parts.query if parts.query else '')
+            try:
+                status, headers, body = self._pool(url).request(
+                    path, {'User-Agent': 'gutenprint', 'Accept': 'text/html'})
+            except (OSError, http.client.HTTPException) as e:
+                raise SourceError(f"{url}: {e}") from e
+            if status in (301, 302, 303, 307, 308) and headers.get('Location'):
+                url = urljoin(url, headers['Location'])
+                continue
+            return status, body, url
+        raise SourceError(f"{url}: too many redirects")
+
+    def fetch(self, book_id):
+        for path in self.PATHS:
+            status, body, url = self._get(self.base_url + path.format(id=book_id))
+            if status == 200:
+                return body, url
+            if status not in (404, 410):
+                raise SourceError(f"{url}: HTTP {status}")
+        raise BookNotFound(book_id)
+
+
+class BookStore:
+    """
+    Fetched books kept as UTF-8 `<id>.html` files in `directory`, with an
+    `index.json` recording size, sha256, origin, original encoding and
+    fetch time of each book.
+    Concurrent requests for the same missing book share a single fetch.
+    Several processes (gunicorn workers) may share `directory`: the index is
+    re-read and merged under a file lock before every write.
+    """
+
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = 'index.lock'
+
+    def __init__(self, directory, source):
+        self.directory = directory
+        self.source = source
+        self.hits = 0
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._book_locks = {}
+        os.makedirs(directory, exist_ok=True)
+        self._index = self._read_index()
+
+    def path(self, book_id):
+        return os.path.join(self.directory, f'{int(book_id)}.html')
+
+    def entry(self, book_id):
+        with self._lock:
+            return self._index.get(str(int(book_id)))
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, self.INDEX_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update_index(self, book_id, entry):
+        # Called with self._lock held. Entries written meanwhile by other
+        # processes are merged in, so the last writer does not drop them
+        with open(os.path.join(self.directory, self.LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self._read_index()
+            index[str(book_id)] = entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, os.path.join(self.directory, self.INDEX_FILE))
+        self._index = index
+
+    def ensure(self, book_id):
+        """Path of the stored HTML of `book_id`, fetched from the source first if needed."""
+        book_id = int(book_id)
+        path = self.path(book_id)
+        with self._lock:
+            book_lock = self._book_locks.setdefault(book_id, threading.Lock())
+        with book_lock:
+            if os.path.exists(path):
+                with self._lock:
+                    self.hits += 1
+                    entry = self._index.get(str(book_id))
+                if entry is not None and 'encoding' not in entry:
+                    # Stored as fetched, before books were converted to UTF-8
+                    with open(path, 'rb') as f:
+                        self._store(book_id, f.read(), entry['origin'], entry['fetched'])
+                return path
+            data, origin = self.source.fetch(book_id)
+            self._store(book_id, data, origin, time.time())
+            with self._lock:
+                self.fetches += 1
+        return path
+
+    def _store(self, book_id, data, origin, fetched):
+        # Called with the book's lock held. Books are kept in UTF-8 whatever they
+        # were published in (Gutenberg's -h.htm files are often ISO-8859-1)
+        data, encoding = to_utf8(data)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(book_id))
+        with self._lock:
+            self._update_index(book_id, {
+                'size': len(data),
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'origin': origin,
+                'encoding': encoding,
+                'fetched': fetched,
+            })
+
+    def get(self, book_id):
+        with open(self.ensure(book_id), 'rb') as f:
+            return f.read()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'fetches': self.fetches,
+                'books': len(self._index),
+                'bytes': sum(entry['size'] for entry in self._index.values()),
+            }
@@ -0,0 +1,184 @@
+"""
+imposition.py
+Page schemes for printing a book on sheets: folded signatures with 2, 4 or 8
+pages per sheet side (one, two or three folds) and cut-and-stack layouts, on
+A4, A3 or SRA3 paper. Folded schemes are derived by simulating the folds of
+one sheet, so every layout shares the same signature splitting, padding and
+sheet nesting. Also counts paper and machine operations per copy and ranks
+the layouts that can produce a given finished page size.
+"""
+from collections import namedtuple
+
+MM_TO_PT = 72.0 / 25.4
+
+# Portrait (width, height) in points
+SHEET_FORMATS = {
+    'A4': (595.276, 841.89),
+    'A3': (841.89, 1190.551),
+    'SRA3': (320 * MM_TO_PT, 450 * MM_TO_PT),
+}
+DEFAULT_SHEET = 'A4'
+
+# folds, in order: 'v' lays the left half over the right one, 'h' the top half
+# over the bottom one; the last fold is the spine. No folds: cut-and-stack.
+Layout = namedtuple('Layout', 'name cols rows folds')
+LAYOUTS = {
+    'fold2': Layout('fold2', 2, 1, ('v',)),
+    'fold4': Layout('fold4', 2, 2, ('h', 'v')),
+    'fold8': Layout('fold8', 4, 2, ('v', 'h', 'v')),
+    'stack2': Layout('stack2', 2, 1, ()),
+    'stack4': Layout('stack4', 2, 2, ()),
+    'stack8': Layout('stack8', 4, 2, ()),
+}
+DEFAULT_LAYOUT = 'fold2'
+
+
+def pages_per_sheet(layout):
+    return 2 * layout.cols * layout.rows
+
+
+def sheet_size(layout, sheet):
+    # Oriented so that the cells are portrait
+    width, height = SHEET_FORMATS[sheet]
+    return (height, width) if layout.cols > layout.rows else (width, height)
+
+
+def page_size_mm(layout, sheet):
+    width, height = sheet_size(layout, sheet)
+    return width / layout.cols / MM_TO_PT, height / layout.rows / MM_TO_PT
+
+
+def round_signature(layout, signature):
+    # Signatures are made of whole sheets
+    per_sheet = pages_per_sheet(layout)
+    return max(per_sheet, -(-signature // per_sheet) * per_sheet)
+
+
+def fold_scheme(layout):
+    """
+    Pages of one folded sheet, in reading order: a list of (side, cell,
+    rotate) where side 0 is the front, cell the row-major index of the cell
+    as seen on that side (the back is seen after turning the sheet over
+    left to right) and rotate 0 or 180.
+    """
+    cols, rows = layout.cols, layout.rows
+    width, height, depth = cols, rows, 1
+    # Cell (row, col) seen from the front -> [x, y, layer from the bottom, face down, head flips]
+    cells = {(r, c): [c, r, 0, False, 0] for r in range(rows) for c in range(cols)}
+    for fold in layout.folds:
+        for cell in cells.values():
+            x, y, z, face_down, head_flips = cell
+            if fold == 'v':
+                if x < width // 2:
+                    cell[:] = [width - 1 - x - width // 2, y, 2 * depth - 1 - z, not face_down, head_flips]
+                else:
+                    cell[0] = x - width // 2
+            elif y < height // 2:
+                # Turned over top to bottom: the page ends upside down
+                cell[:] = [x, height - 1 - y - height // 2, 2 * depth - 1 - z, not face_down, head_flips + 1]
+            else:
+                cell[1] = y - height // 2
+        if fold == 'v':
+            width //= 2
+        else:
+            height //= 2
+        depth *= 2
+    scheme = [None] * pages_per_sheet(layout)
+    for (r, c), (_, _, z, face_down, head_flips) in cells.items():
+        leaf = depth - 1 - z  # from the top of the folded sheet
+        rotate = 180 if head_flips % 2 else 0
+        up_side = 1 if face_down else 0
+        for page, side in ((2 * leaf, up_side), (2 * leaf + 1, 1 - up_side)):
+            col = c if side == 0 else cols - 1 - c
+            scheme[page] = (side, r * cols + col, rotate)
+    return scheme
+
+
+def signature_sheets(layout, signature):
+    """
+    Imposition of one signature of `signature` pages (a multiple of
+    pages_per_sheet): one (first side, second side) pair per sheet, outermost
+    sheet first, each side a list of (cell, page, rotate) sorted by cell with
+    `page` the 0-based page index in the signature. The first side is the
+    one carrying the first page of the sheet.
+    """
+    per_sheet = pages_per_sheet(layout)
+    if signature <= 0 or signature % per_sheet:
+        raise ValueError(f"signature must be a multiple of {per_sheet} for {layout.name}")
+    sheets_count = signature // per_sheet
+    cells = layout.cols * layout.rows
+    sheets = []
+    if layout.folds:
+        scheme = fold_scheme(layout)
+        half = per_sheet // 2
+        first_side = scheme[0][0]
+        for i in range(sheets_count):
+            sides = ([], [])
+            for p, (side, cell, rotate) in enumerate(scheme):
+                # Nested sheets: the first half of a sheet comes before the inner sheets, the second half after
+                page = i * half + p if p < half else signature - per_sheet + p - i * half
+                sides[side].append((cell, page, rotate))
+            sheets.append((sorted(sides[first_side]), sorted(sides[1 - first_side])))
+    else:
+        # Cut-and-stack: cutting the stack gives one pile per cell, piled up in cell order
+        for s in range(sheets_count):
+            front, back = [], []
+            for cell in range(cells):
+                r, c = divmod(cell, layout.cols)
+                leaf = cell * sheets_count + s
+                front.append((cell, 2 * leaf, 0))
+                back.append((r * layout.cols + layout.cols - 1 - c, 2 * leaf + 1, 0))
+            sheets.append((front, sorted(back)))
+    return sheets
+
+
+def signature_sizes(page_count, signature, unit):
+    # Full signatures, then the remaining pages padded to a multiple of `unit`
+    sizes = [signature] * (page_count // signature)
+    rest = page_count % signature
+    if rest:
+        sizes.append(-(-rest // unit) * unit)
+    return sizes
+
+
+def paper_usage(layout_name, sheet, page_count, signature=16):
+    """Paper and machine operations for one copy of a `page_count`-page book."""
+    layout = LAYOUTS[layout_name]
+    signature = round_signature(layout, signature)
+    sizes = signature_sizes(page_count, signature, pages_per_sheet(layout))
+    sheets = sum(sizes) // pages_per_sheet(layout)
+    width_mm, height_mm = page_size_mm(layout, sheet)
+    return {
+        'layout': layout_name,
+        'sheet': sheet,
+        'page_mm': [round(width_mm, 1), round(height_mm, 1)],
+        'signature': signature,
+        'signatures': len(sizes),
+        'sheets': sheets,
+        'impressions': 2 * sheets,
+        # Each sheet goes through the folder on its own
+        'folds': sheets * len(layout.folds),
+        # Guillotine cuts per stack; folded layouts only need the usual trim
+        'cuts': 0 if layout.folds else len(sizes) * (layout.cols - 1 + layout.rows - 1),
+        'blank_pages': sum(sizes) - page_count,
+    }
+
+
+def choose_layout(page_count, signature=16, page_mm=None, sheets=None, layouts=None):
+    """
+    paper_usage of every layout / sheet combination whose pages are at least
+    `page_mm` (width, height; default: the fold2 page on A4, i.e. A5), best
+    first: fewest sheets, then fewest folds and cuts, then smallest sheet.
+    """
+    width_mm, height_mm = page_mm or page_size_mm(LAYOUTS[DEFAULT_LAYOUT], DEFAULT_SHEET)
+    candidates = []
+    for name in layouts or LAYOUTS:
+        for sheet in sheets or SHEET_FORMATS:
+            cell_w, cell_h = page_size_mm(LAYOUTS[name], sheet)
+            if cell_w + 0.5 < width_mm or cell_h + 0.5 < height_mm:
+                continue
+            usage = paper_usage(name, sheet, page_count, signature)
+            area = SHEET_FORMATS[sheet][0] * SHEET_FORMATS[sheet][1]
+            candidates.append(((usage['sheets'], usage['folds'] + usage['cuts'], area), usage))
+    candidates.sort(key=lambda item: item[0])
+    return [usage for _, usage in candidates]
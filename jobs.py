@@ -0,0 +1,327 @@
+"""
+jobs.py
+Asynchronous render jobs executed in a fixed-size process pool.
+
+The pool is bounded: once `max_workers + max_queued` jobs are pending, new
+submissions raise QueueFull so the caller can answer 429. Workers report
+progress through a multiprocessing queue drained by a thread in the parent.
+A pool broken by a dying worker (OOM kill, crash) is replaced on the next
+submission. With `max_tasks_per_child`, the pool is also replaced after
+`max_workers * max_tasks_per_child` jobs, so that memory leaked by the
+renders is given back; the old pool finishes its jobs first.
+
+With a `state_dir`, every job's status is also written there as JSON, so
+that the other processes serving the same API (gunicorn workers) can answer
+for jobs they did not start.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Fields of a job written to its status file
+STATE_FIELDS = ('id', 'status', 'stage', 'progress', 'created', 'started', 'finished', 'error', 'key', 'size')
+
+# Set in each worker process by _init_worker
+_progress_queue = None
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_job(job_id, fn, args, kwargs):
+    def report(stage, progress):
+        if _progress_queue is not None:
+            _progress_queue.put((job_id, stage, progress))
+
+    report(RUNNING, 0.0)
+    return fn(*args, progress=report, **kwargs)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # e.g. EPERM: it exists
+    return True
+
+
+class JobQueue:
+    def __init__(self, max_workers=None, max_queued=None, ttl_seconds=900, state_dir=None, max_tasks_per_child=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queued = self.max_workers * 2 if max_queued is None else max_queued
+        self.ttl_seconds = ttl_seconds
+        self.state_dir = state_dir
+        self.max_tasks_per_child = max_tasks_per_child
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = None
+        self._executor_jobs = 0
+        self._progress_queue = None
+        self._pool_lock = threading.Lock()
+        # Serializes status file writes, so an older state never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._next_sweep = 0.0
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def _ensure_executor(self):
+        # Created lazily so importing the server never forks. Called with self._pool_lock held
+        if self._executor is None:
+            ctx = multiprocessing.get_context()
+            if self._progress_queue is None:
+                self._progress_queue = ctx.Queue()
+                threading.Thread(target=self._drain_progress, args=(self._progress_queue,), daemon=True).start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(self._progress_queue,),
+            )
+            self._executor_jobs = 0
+        return self._executor
+
+    def _discard_broken_executor(self):
+        # Called with self._pool_lock held. The jobs it was running have already
+        # failed with BrokenProcessPool; its progress queue may have died with
+        # the worker that held its lock, so it is replaced too
+        self._executor.shutdown(wait=False)
+        self._executor = None
+        self._progress_queue.put(None)  # stops its drain thread
+        self._progress_queue = None
+
+    def _submit_to_pool(self, *args):
+        with self._pool_lock:
+            if (self._executor is not None and self.max_tasks_per_child
+                    and self._executor_jobs >= self.max_workers * self.max_tasks_per_child):
+                # Retired: its queued and running jobs still complete, reporting
+                # progress on the queue shared with the new pool
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            try:
+                future = self._ensure_executor().submit(*args)
+            except BrokenProcessPool:
+                self._discard_broken_executor()
+                future = self._ensure_executor().submit(*args)
+            self._executor_jobs += 1
+            return future
+
+    def _drain_progress(self, progress_queue):
+        while True:
+            try:
+                message = progress_queue.get()
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+            job_id, stage, progress = message
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job['status'] in (DONE, FAILED):
+                    continue
+                if job['status'] == QUEUED:
+                    job['status'] = RUNNING
+                    job['started'] = time.time()
+                job['stage'] = stage
+                job['progress'] = progress
+            self._save(job)
+
+    def _new_job(self):
+        now = time.time()
+        return {
+            'id': uuid.uuid4().hex,
+            'status': QUEUED,
+            'stage': QUEUED,
+            'progress': 0.0,
+            'created': now,
+            'started': None,
+            'finished': None,
+            'error': None,
+            'result': None,
+            'key': None,
+            'size': None,
+            'on_done': None,
+        }
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [j for j, job in self._jobs.items() if job['finished'] and job['finished'] < cutoff]:
+            del self._jobs[job_id]
+            self._remove_state(job_id)
+
+    # ---------------- status files (state_dir) ----------------
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f'{job_id}.json')
+
+    def _save(self, job):
+        # Called without self._lock held
+        if not self.state_dir:
+            return
+        with self._save_lock:
+            with self._lock:
+                state = {k: job[k] for k in STATE_FIELDS}
+            state['pid'] = os.getpid()
+            fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self._state_path(job['id']))
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _remove_state(self, job_id):
+        if self.state_dir:
+            try:
+                os.remove(self._state_path(job_id))
+            except OSError:
+                pass
+
+    def _load(self, job_id):
+        # Job started by another process, read from its status file
+        if not self.state_dir or not job_id.isalnum():
+            return None
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state['finished'] and state['finished'] < time.time() - self.ttl_seconds:
+            self._remove_state(job_id)
+            return None
+        if state['status'] in (QUEUED, RUNNING) and not _process_alive(state['pid']):
+            # Its process was killed (timeout, crash): the job will never finish
+            state.update(status=FAILED, stage=FAILED, finished=time.time(), error='The worker process exited.')
+            self._save(state)
+        state.update(result=None, on_done=None)
+        return state
+
+    def _sweep_state_dir(self):
+        # Expires the status files no process reads anymore (their owner exited), at most once per TTL
+        if not self.state_dir or time.time() < self._next_sweep:
+            return
+        self._next_sweep = time.time() + self.ttl_seconds
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.state_dir):
+            job_id = name[:-len('.json')]
+            try:
+                stale = name.endswith('.json') and os.path.getmtime(os.path.join(self.state_dir, name)) < cutoff
+            except OSError:
+                continue
+            if stale and job_id not in self._jobs:
+                self._load(job_id)
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['status'] in (QUEUED, RUNNING))
+
+    def submit(self, fn, *args, on_done=None, key=None, **kwargs):
+        """
+        Queue fn(*args, progress=callback, **kwargs) in the pool and return the job id.
+        on_done(job) is called in the parent once the job succeeded. With a `key`,
+        on_done is expected to store job['result'] elsewhere (e.g. the PDF cache
+        under that key): the job then only keeps the key and the result size.
+        """
+        self._sweep_state_dir()
+        with self._lock:
+            self._purge_expired()
+            pending = sum(1 for job in self._jobs.values() if job['status'] in (QUEUED, RUNNING))
+            if pending >= self.max_workers + self.max_queued:
+                raise QueueFull()
+            job = self._new_job()
+            job['on_done'] = on_done
+            job['key'] = key
+            self._jobs[job['id']] = job
+        self._save(job)
+        try:
+            future = self._submit_to_pool(_run_job, job['id'], fn, args, kwargs)
+        except Exception:
+            # Never queued: the record must not count as pending
+            with self._lock:
+                self._jobs.pop(job['id'], None)
+            self._remove_state(job['id'])
+            raise
+        future.add_done_callback(lambda f, job_id=job['id']: self._finish(job_id, f))
+        return job['id']
+
+    def add_finished(self, key, size=None):
+        """Register a result already stored under `key` (e.g. a cache hit) as a done job."""
+        job = self._new_job()
+        job.update(status=DONE, stage=DONE, progress=1.0, key=key, size=size)
+        job['started'] = job['finished'] = job['created']
+        self._sweep_state_dir()
+        with self._lock:
+            self._purge_expired()
+            self._jobs[job['id']] = job
+        self._save(job)
+        return job['id']
+
+    def _finish(self, job_id, future):
+        error = future.exception()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished'] = time.time()
+            if job['started'] is None:
+                job['started'] = job['created']
+            if error is None:
+                job['result'] = future.result()
+        if job['on_done'] is not None and error is None:
+            # Before the job turns DONE: a client seeing DONE can fetch what on_done stored
+            try:
+                job['on_done'](job)
+            except Exception as e:
+                error = e
+        with self._lock:
+            if error is not None:
+                job.update(status=FAILED, stage=FAILED, error=str(error), result=None)
+            else:
+                result = job['result']
+                job.update(status=DONE, stage=DONE, progress=1.0, size=len(result) if result is not None else None)
+                if job['key'] is not None:
+                    # Stored under its key by on_done: no copy kept for the job's whole TTL
+                    job['result'] = None
+        self._save(job)
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._load(job_id)
+
+    def status(self, job_id):
+        """JSON-friendly view of a job, without the result payload."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        info = {k: job[k] for k in ('id', 'status', 'stage', 'progress', 'created', 'started', 'finished', 'error')}
+        if job['status'] == QUEUED and job_id in self._jobs:
+            with self._lock:
+                info['position'] = sum(
+                    1 for other in self._jobs.values()
+                    if other['status'] == QUEUED and other['created'] < job['created']
+                )
+        if job['size'] is not None:
+            info['size'] = job['size']
+        return info
@@ -0,0 +1,178 @@
+"""
+metrics.py
+Minimal Prometheus-style metrics (counters, gauges, histograms) rendered in
+the text exposition format, plus a per-request stage timer used for the
+histograms and the Server-Timing header.
+"""
+import threading
+import time
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PAGES_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2000, 5000)
+BYTES_BUCKETS = (1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(k)} {_format_value(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge whose samples are read from `callback()` -> {labels tuple: value} at render time."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def render(self):
+        samples = self.callback() if self.callback else {}
+        lines = self.header()
+        for values, value in sorted(samples.items()):
+            labels = tuple(zip(self.labelnames, values))
+            lines.append(f'{self.name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """Counter whose running totals are read from `callback()`, like Gauge (counts kept by another object)."""
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = key + (('le', _format_value(bound)),)
+                lines.append(f'{self.name}_bucket{_format_labels(labels)} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {counts[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def callback_counter(self, *args, **kwargs):
+        return self.register(CallbackCounter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """
+    Times consecutive stages of one request. `mark(stage)` closes the running
+    stage and starts the next one; its (stage, fraction) signature matches the
+    progress callbacks of render_pdf and create_booklet, whose stage names
+    are normalized through `aliases`.
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+        self.durations = []  # [(stage, seconds)] in order
+        self.started = time.perf_counter()
+        self._current = None
+        self._current_start = None
+
+    def mark(self, stage, fraction=None):
+        now = time.perf_counter()
+        self._close(now)
+        self._current = self.aliases.get(stage, stage)
+        self._current_start = now
+
+    def stop(self):
+        self._close(time.perf_counter())
+
+    def _close(self, now):
+        if self._current is not None:
+            self.durations.append((self._current, now - self._current_start))
+            self._current = None
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        # Server-Timing header value, durations in milliseconds
+        parts = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in self.durations]
+        parts.append(f'total;dur={self.total() * 1000:.1f}')
+        return ', '.join(parts)
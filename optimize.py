@@ -0,0 +1,90 @@
+"""
+optimize.py
+Optional size optimization pass for rendered PDFs and booklets: images shown
+above the target resolution are downsampled and recompressed as JPEG, fonts
+are subset, and the document is saved with identical streams merged so a
+repeated image is embedded only once.
+"""
+import math
+
+import fitz  # PyMuPDF
+
+DEFAULT_IMAGE_DPI = 150
+DEFAULT_JPEG_QUALITY = 80
+# Images are left alone up to 1.5x the target resolution (Ghostscript's default threshold)
+DOWNSAMPLE_THRESHOLD = 1.5
+# garbage=4 also merges objects with identical streams (deduplicated images)
+SAVE_OPTIONS = {'garbage': 4, 'deflate': True}
+
+
+def image_resolutions(doc):
+    """Lowest resolution (dpi) at which each image xref is shown in `doc`."""
+    resolutions = {}
+    for page in doc:
+        for info in page.get_image_info(xrefs=True):
+            xref = info['xref']
+            if not xref:
+                continue  # inline image
+            a, b, c, d, _, _ = info['transform']
+            width_in = math.hypot(a, b) / 72.0
+            height_in = math.hypot(c, d) / 72.0
+            if not width_in or not height_in:
+                continue
+            dpi = min(info['width'] / width_in, info['height'] / height_in)
+            resolutions[xref] = min(dpi, resolutions.get(xref, dpi))
+    return resolutions
+
+
+def downsample_images(doc, dpi=DEFAULT_IMAGE_DPI, quality=DEFAULT_JPEG_QUALITY):
+    """
+    Resample, in place, the images shown above DOWNSAMPLE_THRESHOLD * `dpi`
+    down to `dpi` and store them as JPEG. Images with a soft mask or a bit
+    depth other than 8 (line art, masks) are kept as they are. Returns the
+    number of image stream bytes saved.
+    """
+    saved = 0
+    for xref, shown_dpi in image_resolutions(doc).items():
+        if shown_dpi <= dpi * DOWNSAMPLE_THRESHOLD:
+            continue
+        if (doc.xref_get_key(xref, 'SMask')[0] != 'null' or doc.xref_get_key(xref, 'Mask')[0] != 'null'
+                or doc.xref_get_key(xref, 'BitsPerComponent')[1] != '8'):
+            continue
+        original_size = len(doc.xref_stream_raw(xref))
+        pixmap = fitz.Pixmap(doc, xref)
+        if pixmap.n not in (1, 3):
+            pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+        scale = dpi / shown_dpi
+        pixmap = fitz.Pixmap(pixmap, max(1, round(pixmap.width * scale)), max(1, round(pixmap.height * scale)), None)
+        data = pixmap.tobytes('jpeg', jpg_quality=quality)
+        if len(data) >= original_size:
+            continue
+        # Same xref, so every page (or form XObject) using the image gets the new one
+        doc.update_stream(xref, data, compress=False)
+        for key, value in (
+            ('Filter', '/DCTDecode'),
+            ('DecodeParms', 'null'),
+            ('Decode', 'null'),
+            ('Width', str(pixmap.width)),
+            ('Height', str(pixmap.height)),
+            ('ColorSpace', '/DeviceGray' if pixmap.n == 1 else '/DeviceRGB'),
+        ):
+            doc.xref_set_key(xref, key, value)
+        saved += original_size - len(data)
+    return saved
+
+
+def optimize_pdf(doc, dpi=DEFAULT_IMAGE_DPI, quality=DEFAULT_JPEG_QUALITY, subset_fonts=True):
+    """
+    Downsample images and subset fonts of `doc` in place; save it with
+    SAVE_OPTIONS afterwards. Returns the image stream bytes saved.
+    """
+    saved = downsample_images(doc, dpi, quality)
+    if subset_fonts:
+        doc.subset_fonts()
+    return saved
+
+
+def optimize_pdf_bytes(pdf_bytes, dpi=DEFAULT_IMAGE_DPI, quality=DEFAULT_JPEG_QUALITY):
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        optimize_pdf(doc, dpi, quality)
+        return doc.tobytes(**SAVE_OPTIONS)
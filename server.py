@@ -1,136 +1,155 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+import base64
+import cProfile
+import hashlib
+import html
 import io
+import json
 import os
+import functools
 import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from weasyprint import HTML, CSS
-from bs4 import BeautifulSoup, NavigableString, Tag
+from weasyprint.text.fonts import FontConfiguration
+import fitz  # PyMuPDF
+import lxml.html
+from lxml import etree
+from cache import TieredCache, content_key
+from charsets import declared_charset, is_utf8, normalize_charset
+from gutenberg import BookNotFound, BookStore, HttpSource, MirrorSource, SourceError
+from jobs import DONE, FAILED, JobQueue, QueueFull
+from metrics import BYTES_BUCKETS, PAGES_BUCKETS, Registry, StageTimer
+from sharding import render_sharded
+from booklet import create_booklet
+from imposition import DEFAULT_LAYOUT, DEFAULT_SHEET, LAYOUTS, SHEET_FORMATS
+from optimize import DEFAULT_IMAGE_DPI, DEFAULT_JPEG_QUALITY, optimize_pdf_bytes
+from uploads import BodyTooLarge, UnsupportedEncoding, spool_body
 
 app = Flask(__name__)
 
 # Configure CORS
 frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
-CORS(app, resources={r"/api/*": {"origins": frontend_url}})
-
-def clean_gutenberg_html(html_content, title=None, author=None):
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # --- 1. Suppression fiable du HEADER Gutenberg ---
-    start_marker_text = r'\*\*\*\s*START OF (THE|THIS)?\s*PROJECT GUTENBERG EBOOK'
-    start_marker = soup.find(string=lambda t: t and re.search(start_marker_text, t, re.IGNORECASE | re.DOTALL))
-
-    if start_marker:
-        element_to_delete = start_marker.parent
-        while element_to_delete.parent != soup.body and element_to_delete.parent is not None:
-            element_to_delete = element_to_delete.parent
-        for sibling in list(element_to_delete.find_previous_siblings()):
-            sibling.decompose()
-        element_to_delete.decompose()
-
-    # --- 2. Suppression fiable du FOOTER Gutenberg ---
-    end_marker_text = r'\*\*\*\s*END OF (THE|THIS)?\s*PROJECT GUTENBERG EBOOK.*'
-    end_marker = soup.find(string=lambda t: t and re.search(end_marker_text, t, re.IGNORECASE | re.DOTALL))
-
-    if end_marker:
-        element_to_delete = end_marker.parent
-        while element_to_delete.parent != soup.body and element_to_delete.parent is not None:
-            element_to_delete = element_to_delete.parent
-        for sibling in list(element_to_delete.find_next_siblings()):
-            sibling.decompose()
-        element_to_delete.decompose()
-
-    # --- 3. Si le body est vide maintenant, on crée un body minimal ---
-    if not soup.body or not soup.body.contents:
-        soup.body = soup.new_tag('body')
-
-    # --- 4. Détection des chapitres pour les sauts de page (amélioré avec plus de variantes) ---
-    chapter_pattern = re.compile(
-        r'^\s*'
-        r'(?:Chapitre|Livre|Partie|Lettre|Préface|Introduction|Conclusion|Chapitre premier|Chapitre dernier|Prologue|Épilogue)'
-        r'(?:\s+[IVXLCDM\d]+)?[\s\.:-]*$'
-        r'|'
-        r'^\s*M{0,3}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})[\s\.:-]*$',
-        re.IGNORECASE
-    )
+CORS(app, resources={r"/api/*": {"origins": frontend_url}},
+     expose_headers=['Content-Location', 'ETag', 'X-Cache', 'X-Bytes-Saved', 'X-Image-Bytes-Saved'])
 
-    # --- Nouvelle étape : Suppression de tout avant le premier chapitre ou préface ---
-    first_content_element = None
-    for header in soup.body.find_all(['h1', 'h2', 'h3']):
-        text = header.get_text(strip=True)
-        if chapter_pattern.match(text):
-            first_content_element = header
-            break
+# Largest accepted book, checked after decompression (JSON, raw text/html or multipart upload)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_MB', '64')) * 1024 * 1024
+# Also enforced by werkzeug while parsing multipart uploads
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+# Request bodies above this size are spooled to disk while they are decoded
+UPLOAD_SPOOL_BYTES = int(os.environ.get('UPLOAD_SPOOL_MB', '8')) * 1024 * 1024
 
-    if first_content_element:
-        element_to_keep = first_content_element
-        while element_to_keep.parent != soup.body and element_to_keep.parent is not None:
-            element_to_keep = element_to_keep.parent
-        for sibling in list(element_to_keep.find_previous_siblings()):
-            sibling.decompose()
+# PDFs above this size are spooled to disk while rendering and never kept in memory
+PDF_SPOOL_BYTES = int(os.environ.get('PDF_SPOOL_MB', '8')) * 1024 * 1024
 
-    # --- 5. Création du nouveau body propre ---
-    new_body = soup.new_tag('body')
+# Booklets of PDFs with at least this many pages are imposed in low-memory mode (0 = never)
+BOOKLET_LOW_MEMORY_PAGES = int(os.environ.get('BOOKLET_LOW_MEMORY_PAGES', '0'))
 
-    # --- 6. Page de titre ---
-    if title:
-        title_page = soup.new_tag('div', **{'class': 'title-page'})
-        h1 = soup.new_tag('h1')
-        h1.string = title
-        title_page.append(h1)
-        if author:
-            p_author = soup.new_tag('p', **{'class': 'author'})
-            p_author.string = author
-            title_page.append(p_author)
-        new_body.append(title_page)
-        new_body.append(soup.new_tag('div', **{'class': 'blank-page'}))
+# Rendered PDF cache: memory LRU in front of a size-bounded disk directory
+PDF_CACHE = TieredCache(
+    max_memory_bytes=int(os.environ.get('PDF_CACHE_MEMORY_MB', '256')) * 1024 * 1024,
+    directory=os.environ.get('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gutenprint-pdf-cache')),
+    max_disk_bytes=int(os.environ.get('PDF_CACHE_DISK_MB', '2048')) * 1024 * 1024,
+    suffix='.pdf',
+    max_memory_entry_bytes=PDF_SPOOL_BYTES,
+)
 
-    # --- 7. Ajout du contenu nettoyé + marquage des chapitres ---
-    is_first_chapter = True
-    for element in list(soup.body.children):  # list() pour éviter modifications pendant itération
-        if isinstance(element, Tag) and element.name in ['h1', 'h2', 'h3']:
-            text = element.get_text(strip=True)
-            if chapter_pattern.match(text):
-                if not is_first_chapter:
-                    element['class'] = element.get('class', []) + ['section-break']
-                else:
-                    is_first_chapter = False
-        if isinstance(element, Tag):
-            new_body.append(element)
-        elif isinstance(element, NavigableString) and element.strip():
-            new_body.append(element)
+# Cleaned document bodies keyed by source hash, memory only (LRU by size)
+CLEAN_CACHE = TieredCache(max_memory_bytes=int(os.environ.get('CLEAN_CACHE_MEMORY_MB', '128')) * 1024 * 1024)
 
-    # --- 8. Remplacement du body ---
-    if soup.body:
-        soup.body.replace_with(new_body)
-    else:
-        soup.append(new_body)
+# Gutenberg books fetched by id ("book_id"): a local mirror directory when
+# GUTENBERG_MIRROR_DIR is set, HTTP otherwise, kept in a persistent store
+if os.environ.get('GUTENBERG_MIRROR_DIR'):
+    BOOK_SOURCE = MirrorSource(os.environ['GUTENBERG_MIRROR_DIR'])
+else:
+    BOOK_SOURCE = HttpSource(
+        os.environ.get('GUTENBERG_BASE_URL', 'https://www.gutenberg.org'),
+        pool_size=int(os.environ.get('GUTENBERG_POOL_SIZE', '4')),
+    )
+BOOK_STORE = BookStore(
+    os.environ.get('BOOK_STORE_DIR', os.path.join(tempfile.gettempdir(), 'gutenprint-books')), BOOK_SOURCE)
 
-    return str(soup)
+# Renders after which the job and shard process pools are replaced, like
+# the gunicorn workers themselves (gunicorn.conf.py)
+POOL_MAX_RENDERS = int(os.environ.get('WORKER_MAX_RENDERS', '200'))
 
-@app.route('/api/convert', methods=['POST'])
-def convert_to_pdf():
-    # Limit the size of the incoming request
-    if request.content_length > 10 * 1024 * 1024:  # 10 MB limit
-        return jsonify({"error": "Request payload is too large."}), 413
+# Background renders for /api/jobs: fixed-size process pool with a bounded backlog.
+# Job statuses are shared through RENDER_JOBS_DIR, so that any gunicorn worker
+# can answer for a job; the PDFs are served from the shared PDF_CACHE directory
+RENDER_JOBS = JobQueue(
+    max_workers=int(os.environ.get('RENDER_WORKERS', '0')) or None,
+    max_queued=int(os.environ['RENDER_QUEUE_SIZE']) if 'RENDER_QUEUE_SIZE' in os.environ else None,
+    ttl_seconds=int(os.environ.get('RENDER_JOB_TTL', '900')),
+    state_dir=os.environ.get('RENDER_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'gutenprint-jobs')),
+    max_tasks_per_child=POOL_MAX_RENDERS,
+)
 
-    if not request.is_json:
-        return jsonify({"error": "Unsupported Media Type. Must be application/json."}), 415
+# Worker processes for chapter-sharded renders (mode "sharded"), created on first use
+# and replaced after POOL_MAX_RENDERS sharded renders
+_shard_pool = None
+_shard_pool_renders = 0
+_shard_pool_lock = threading.Lock()
 
-    try:
-        data = request.get_json()
-        html_content = data.get('html_content')
-        title = data.get('title')
-        author = data.get('author')
+def get_shard_pool():
+    global _shard_pool, _shard_pool_renders
+    with _shard_pool_lock:
+        if _shard_pool is None or _shard_pool_renders >= POOL_MAX_RENDERS:
+            # Dropping the last reference to the old pool shuts it down once the
+            # renders still using it are done
+            _shard_pool = ProcessPoolExecutor(max_workers=int(os.environ.get('SHARD_WORKERS', '0')) or None)
+            _shard_pool_renders = 0
+        _shard_pool_renders += 1
+        return _shard_pool
 
-        if not html_content:
-            return jsonify({"error": "html_content is required."}), 400
+def discard_shard_pool(pool):
+    # `pool` lost a worker (OOM kill, crash) and rejects all work: the next render gets a new one
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is pool:
+            _shard_pool = None
+    pool.shutdown(wait=False)
 
-        cleaned_html = clean_gutenberg_html(html_content, title, author)
+# Prometheus metrics served on /metrics
+METRICS = Registry()
+STAGE_SECONDS = METRICS.histogram(
+    'gutenprint_stage_seconds', 'Time spent in each pipeline stage.', ('pipeline', 'stage'))
+REQUEST_SECONDS = METRICS.histogram(
+    'gutenprint_request_seconds', 'Request handling time, excluding the response body transfer.', ('pipeline', 'status'))
+OUTPUT_PAGES = METRICS.histogram(
+    'gutenprint_output_pages', 'Pages per generated PDF.', ('pipeline',), buckets=PAGES_BUCKETS)
+OUTPUT_BYTES = METRICS.histogram(
+    'gutenprint_output_bytes', 'Size of generated PDFs in bytes.', ('pipeline',), buckets=BYTES_BUCKETS)
+CACHES = {'pdf': PDF_CACHE, 'clean': CLEAN_CACHE}
+METRICS.callback_counter('gutenprint_cache_lookups_total', 'Cache lookups, by cache and result.', ('cache', 'result'),
+                         callback=lambda: {(name, result): cache.stats()[result] for name, cache in CACHES.items()
+                                           for result in ('memory_hits', 'disk_hits', 'misses')})
+METRICS.gauge('gutenprint_cache_bytes', 'Bytes held by each cache, by tier.', ('cache', 'tier'),
+              callback=lambda: {(name, tier): cache.stats()[f'{tier}_bytes'] for name, cache in CACHES.items()
+                                for tier in ('memory', 'disk')})
+METRICS.gauge('gutenprint_render_jobs_pending', 'Background renders queued or running.',
+              callback=lambda: {(): RENDER_JOBS.pending()})
+OPTIMIZE_SAVED_BYTES = METRICS.counter(
+    'gutenprint_optimize_saved_bytes_total', 'Bytes removed by the image/font optimization pass.', ('pipeline',))
+# render_pdf / create_booklet progress stages -> metric stage names
+STAGE_ALIASES = {'cleaning': 'clean', 'writing': 'write'}
 
-        css_string = """
+# Server-Timing header on every instrumented response (otherwise only with ?timing=1)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+# cProfile dumps for requests slower than PROFILE_SLOW_MS (0 disables profiling)
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'gutenprint-profiles'))
+# One profiler at a time per process: on Python 3.12+ enabling a second one raises ValueError
+PROFILE_LOCK = threading.Lock()
+
+# Shared print rules; page geometry and font size come from PAGE_PROFILES
+PRINT_CSS = """
     @page {
-        size: A5;
-        margin: 1cm 2cm;
         @bottom-center {
             content: counter(page);
         }
@@ -149,7 +168,6 @@ def convert_to_pdf():
     }
 
     body {
-        font-size: 8pt;
         font-family: serif;
         line-height: 1.5;
     }
@@ -163,7 +181,6 @@ def convert_to_pdf():
         flex-direction: column;
         justify-content: center;
         align-items: center;
-        height: 190mm; /* A5 height 210mm minus 1cm top + 1cm bottom margins */
         text-align: center;
         page-break-after: always;
     }
@@ -200,16 +217,625 @@ def convert_to_pdf():
     }
 """
 
-        pdf_file = io.BytesIO()
-        HTML(string=cleaned_html).write_pdf(pdf_file, stylesheets=[CSS(string=css_string)])
-        pdf_file.seek(0)
+PROFILE_CSS_TEMPLATE = """
+    @page {{
+        size: {size};
+        margin: {margin_v_mm}mm {margin_h_mm}mm;
+    }}
+    body {{
+        font-size: {font_size_pt}pt;
+    }}
+    .title-page {{
+        height: {title_height_mm}mm; /* page height minus top + bottom margins */
+    }}
+"""
+
+# Named print layouts selectable with the "profile" request parameter
+PAGE_PROFILES = {
+    'a5': {'size': 'A5', 'page_width_mm': 148, 'page_height_mm': 210, 'margin_v_mm': 10, 'margin_h_mm': 20,
+           'font_size_pt': 8},
+    'a4': {'size': 'A4', 'page_width_mm': 210, 'page_height_mm': 297, 'margin_v_mm': 20, 'margin_h_mm': 25,
+           'font_size_pt': 11},
+    'large-print': {'size': 'A4', 'page_width_mm': 210, 'page_height_mm': 297, 'margin_v_mm': 20, 'margin_h_mm': 20,
+                    'font_size_pt': 16},
+}
+DEFAULT_PROFILE = 'a5'
+
+# Preview renders (preview_pages) are limited to this many pages
+MAX_PREVIEW_PAGES = int(os.environ.get('MAX_PREVIEW_PAGES', '32'))
+
+# One font configuration for every document, so fonts are discovered only once
+FONT_CONFIG = FontConfiguration()
+
+def profile_css(profile):
+    settings = PAGE_PROFILES[profile]
+    return PRINT_CSS + PROFILE_CSS_TEMPLATE.format(
+        title_height_mm=settings['page_height_mm'] - 2 * settings['margin_v_mm'], **settings
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_stylesheet(profile):
+    # Parsed once per process and profile, then shared by every request
+    return CSS(string=profile_css(profile), font_config=FONT_CONFIG)
+
+@functools.lru_cache(maxsize=None)
+def stylesheet_version(profile):
+    # Part of the PDF cache key: editing the stylesheet invalidates cached renders
+    return hashlib.sha256(profile_css(profile).encode('utf-8')).hexdigest()[:12]
+
+# Place minimale comptée par bloc lors de la coupe d'un aperçu (max_chars)
+PREVIEW_BLOCK_CHARS = 200
+
+# Marqueurs Gutenberg et titres de chapitres, compilés une seule fois
+START_MARKER_RE = re.compile(r'\*\*\*\s*START OF (THE|THIS)?\s*PROJECT GUTENBERG EBOOK', re.IGNORECASE | re.DOTALL)
+END_MARKER_RE = re.compile(r'\*\*\*\s*END OF (THE|THIS)?\s*PROJECT GUTENBERG EBOOK.*', re.IGNORECASE | re.DOTALL)
+CHAPTER_RE = re.compile(
+    r'^\s*'
+    r'(?:Chapitre|Livre|Partie|Lettre|Préface|Introduction|Conclusion|Chapitre premier|Chapitre dernier|Prologue|Épilogue)'
+    r'(?:\s+[IVXLCDM\d]+)?[\s\.:-]*$'
+    r'|'
+    r'^\s*M{0,3}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})[\s\.:-]*$',
+    re.IGNORECASE
+)
+HEADING_TAGS = ('h1', 'h2', 'h3')
+META_CHARSET_RE = re.compile(r'charset\s*=\s*[^\s;]*', re.IGNORECASE)
+
+def _is_tag(node):
+    # Les commentaires lxml sont des éléments dont le tag n'est pas une chaîne
+    return isinstance(node, etree._Element) and isinstance(node.tag, str)
+
+def _is_chapter_heading(element):
+    # Équivalent de get_text(strip=True) : morceaux de texte nettoyés et collés
+    text = ''.join(s.strip() for s in element.itertext())
+    return CHAPTER_RE.match(text) is not None
+
+def _scan_block(block):
+    # Un seul parcours du bloc : marqueurs de début / fin et titre de chapitre
+    has_start = has_end = has_chapter = False
+    for element in block.iter():
+        for text in (element.text, element.tail if element is not block else None):
+            # '***' est obligatoire dans les deux marqueurs : filtre avant la regex
+            if text and '***' in text:
+                has_start = has_start or START_MARKER_RE.search(text) is not None
+                has_end = has_end or END_MARKER_RE.search(text) is not None
+        if not has_chapter and element.tag in HEADING_TAGS and _is_chapter_heading(element):
+            has_chapter = True
+    return has_start, has_end, has_chapter
+
+def _append_text(parent, text):
+    # Ajoute du texte après le dernier enfant (tail) ou dans parent.text
+    if len(parent):
+        parent[-1].tail = (parent[-1].tail or '') + text
+    else:
+        parent.text = (parent.text or '') + text
+
+def _declare_utf8(root):
+    # Le résultat est une chaîne Unicode, rendue en UTF-8 : le charset déclaré par
+    # <meta charset> ou <meta http-equiv="Content-Type"> devient utf-8
+    for meta in root.iter('meta'):
+        if meta.get('charset') is not None:
+            meta.set('charset', 'utf-8')
+        elif (meta.get('http-equiv') or '').lower() == 'content-type' and meta.get('content'):
+            meta.set('content', META_CHARSET_RE.sub('charset=utf-8', meta.get('content')))
+
+def clean_gutenberg_html(html_content, title=None, author=None, max_chars=None):
+    return inject_title_page(clean_gutenberg_body(html_content, max_chars), title, author)
+
+def clean_gutenberg_body(html_content, max_chars=None):
+    # Nettoyage sans page de titre : ne dépend que du HTML source, d'où CLEAN_CACHE.
+    # max_chars : le contenu est coupé une fois ce nombre de caractères atteint (aperçus)
+    if isinstance(html_content, str):
+        html_content = html_content.encode('utf-8')
+    else:
+        # Octets : décodés selon le charset déclaré par le document, UTF-8 sinon
+        encoding = declared_charset(html_content)
+        if not is_utf8(encoding):
+            html_content = html_content.decode(encoding, errors='replace').encode('utf-8')
+    # default_doctype=False : pas de DOCTYPE HTML 4.0 ajouté quand la source n'en a pas
+    root = lxml.html.document_fromstring(
+        html_content, parser=lxml.html.HTMLParser(encoding='utf-8', huge_tree=True, default_doctype=False)
+    )
+    body = root.find('body')
+    if body is None:
+        body = etree.SubElement(root, 'body')
+
+    # Nœuds de premier niveau du body : éléments, commentaires et textes
+    nodes = [body.text] if body.text else []
+    for child in body:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+
+    # --- 1-4. Parcours unique : HEADER, FOOTER Gutenberg et premier chapitre ---
+    # Seuls les éléments sont supprimés, les textes et commentaires restent
+    start_idx = end_idx = chapter_idx = None
+    for idx, node in enumerate(nodes):
+        if not _is_tag(node):
+            continue
+        has_start, has_end, has_chapter = _scan_block(node)
+        if has_start and start_idx is None:
+            # Tout ce qui précède le marqueur de début disparaît avec lui
+            start_idx = idx
+            end_idx = chapter_idx = None
+            continue
+        if end_idx is not None:
+            # Après le footer, seul un marqueur de début peut encore compter
+            continue
+        if has_end:
+            end_idx = idx
+            if start_idx is not None:
+                break
+            continue
+        if has_chapter and chapter_idx is None:
+            chapter_idx = idx
+
+    first_kept = max(start_idx + 1 if start_idx is not None else 0, chapter_idx or 0)
+    last_kept = end_idx - 1 if end_idx is not None else len(nodes) - 1
+
+    # --- 5. Création du nouveau body propre ---
+    # (la page de titre, étape 6, est ajoutée par inject_title_page)
+    new_body = body.makeelement('body', {})
+
+    # --- 7. Ajout du contenu nettoyé + marquage des chapitres ---
+    is_first_chapter = True
+    kept_chars = 0
+    for idx, node in enumerate(nodes):
+        if max_chars is not None and kept_chars >= max_chars:
+            break
+        if isinstance(node, str):
+            if node.strip():
+                _append_text(new_body, node)
+                kept_chars += len(node)
+            continue
+        if not _is_tag(node):
+            # Commentaire / instruction de traitement : gardé s'il n'est pas vide
+            if node.text and node.text.strip():
+                node.tail = None
+                new_body.append(node)
+            continue
+        if idx < first_kept or idx > last_kept:
+            continue
+        node.tail = None
+        if node.tag in HEADING_TAGS and _is_chapter_heading(node):
+            if not is_first_chapter:
+                node.set('class', ' '.join(node.get('class', '').split() + ['section-break']))
+            else:
+                is_first_chapter = False
+        new_body.append(node)
+        if max_chars is not None:
+            # Titres, images et paragraphes courts occupent plus que leur texte
+            kept_chars += max(len(node.text_content()), PREVIEW_BLOCK_CHARS)
+
+    # --- 8. Remplacement du body ---
+    new_body.tail = body.tail
+    root.replace(body, new_body)
+    _declare_utf8(root)
+
+    return etree.tostring(root.getroottree(), encoding='unicode', method='html')
+
+def inject_title_page(cleaned_html, title=None, author=None):
+    # --- 6. Page de titre ---
+    # Insérée juste après la balise <body>, sans attribut, produite par clean_gutenberg_body
+    if not title:
+        return cleaned_html
+    title_page = f'<div class="title-page"><h1>{html.escape(title, quote=False)}</h1>'
+    if author:
+        title_page += f'<p class="author">{html.escape(author, quote=False)}</p>'
+    title_page += '</div><div class="blank-page"></div>'
+    body_start = cleaned_html.index('<body>', max(cleaned_html.find('</head>'), 0)) + len('<body>')
+    return cleaned_html[:body_start] + title_page + cleaned_html[body_start:]
+
+def cleaned_gutenberg_html(html_content, title=None, author=None, source_key=None):
+    # clean_gutenberg_html through CLEAN_CACHE: a book already cleaned once (with
+    # any title or profile) only pays for the title page injection
+    source_key = source_key or content_key(html_content)
+    body_bytes = CLEAN_CACHE.get(source_key)
+    if body_bytes is None:
+        started = time.perf_counter()
+        cleaned_body = clean_gutenberg_body(html_content)
+        CLEAN_CACHE.put(source_key, cleaned_body.encode('utf-8'), cost=time.perf_counter() - started)
+    else:
+        cleaned_body = body_bytes.decode('utf-8')
+    return inject_title_page(cleaned_body, title, author)
+
+def render_pdf(html_content, title=None, author=None, progress=None, sharded=False, profile=DEFAULT_PROFILE,
+               target=None, stats=None, source_key=None):
+    # progress(stage, fraction) is an optional callback used by background jobs and request timers.
+    # Returns the PDF bytes, or writes them to the `target` file and returns None.
+    # The optional `stats` dict receives the page count; `source_key` is content_key(html_content).
+    if progress:
+        progress('cleaning', 0.05)
+    cleaned_html = cleaned_gutenberg_html(html_content, title, author, source_key)
+    if progress:
+        progress('layout', 0.2)
+    if sharded:
+        # Chapters are laid out in parallel; falls through for single-section books,
+        # and when a shard worker died, since retrying could kill the next one too
+        shard_pool = get_shard_pool()
+        try:
+            pdf_bytes = render_sharded(
+                cleaned_html, (profile_css(profile),), shard_pool,
+                stats=stats, margin_bottom_pt=PAGE_PROFILES[profile]['margin_v_mm'] * 72.0 / 25.4,
+            )
+        except BrokenProcessPool:
+            app.logger.warning("Shard worker died, rendering without sharding")
+            discard_shard_pool(shard_pool)
+            pdf_bytes = None
+        if pdf_bytes is not None:
+            if target is None:
+                return pdf_bytes
+            target.write(pdf_bytes)
+            return None
+    document = HTML(string=cleaned_html).render(stylesheets=[get_stylesheet(profile)], font_config=FONT_CONFIG)
+    if stats is not None:
+        stats['pages'] = len(document.pages)
+    if progress:
+        progress('writing', 0.8)
+    return document.write_pdf(target)
+
+# Rendered once by warm_up(): enough text to load Pango, fontconfig and the fonts
+WARM_UP_HTML = ("<html><body><h1>Warm-up</h1>"
+                "<p>The quick brown fox jumps over the lazy dog. « Œuvres complètes », 1–2.</p></body></html>")
+
+def warm_up():
+    # Pays the first-request costs up front: stylesheets of every profile, the cleaner
+    # and one small render. Called in the parent of the prefork server (gunicorn.conf.py)
+    # so forked workers start warm. Returns the seconds spent.
+    started = time.perf_counter()
+    for profile in PAGE_PROFILES:
+        get_stylesheet(profile)
+        stylesheet_version(profile)
+    render_pdf(WARM_UP_HTML, 'Warm-up', 'Gutenprint')
+    return time.perf_counter() - started
+
+def chars_per_page(profile):
+    # Rough amount of text on a full page: half-em wide glyphs, 1.5 line-height
+    p = PAGE_PROFILES[profile]
+    width_pt = (p['page_width_mm'] - 2 * p['margin_h_mm']) * 72.0 / 25.4
+    height_pt = (p['page_height_mm'] - 2 * p['margin_v_mm']) * 72.0 / 25.4
+    return int(width_pt / (0.5 * p['font_size_pt'])) * int(height_pt / (1.5 * p['font_size_pt']))
+
+def render_preview(html_content, title=None, author=None, pages=8, profile=DEFAULT_PROFILE, progress=None):
+    # PDF bytes of the first `pages` pages. Only about enough text to fill them is
+    # cleaned and laid out; the budget is raised when the cut came out short.
+    budget = 2 * (pages + 1) * chars_per_page(profile)
+    for _ in range(3):
+        if progress:
+            progress('cleaning', 0.05)
+        cleaned_html = clean_gutenberg_html(html_content, title, author, max_chars=budget)
+        if progress:
+            progress('layout', 0.2)
+        document = HTML(string=cleaned_html).render(stylesheets=[get_stylesheet(profile)], font_config=FONT_CONFIG)
+        if len(document.pages) >= pages or budget >= len(html_content):
+            break
+        budget *= 4
+    if progress:
+        progress('writing', 0.8)
+    return document.copy(document.pages[:pages]).write_pdf()
+
+def preview_thumbnails(pdf_bytes, width_px=300):
+    # PNG data URIs, one per page, `width_px` wide
+    thumbnails = []
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        for page in doc:
+            zoom = width_px / page.rect.width
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            thumbnails.append('data:image/png;base64,' + base64.b64encode(pixmap.tobytes('png')).decode('ascii'))
+    return thumbnails
+
+def _send_pdf(path_or_file, etag, cache_status=None, location=None, filename='document.pdf'):
+    # conditional=True answers If-None-Match with 304 and Range with 206 (GET only, size known)
+    response = send_file(
+        path_or_file,
+        as_attachment=True,
+        attachment_filename=filename,
+        mimetype='application/pdf',
+        conditional=True,
+        etag=etag,
+    )
+    if cache_status:
+        response.headers['X-Cache'] = cache_status
+    if location:
+        # Resumable GET URL for the same bytes, served from the cache without re-rendering
+        response.headers['Content-Location'] = location
+    return response
 
-        return send_file(
-            pdf_file,
-            as_attachment=True,
-            attachment_filename='document.pdf',
-            mimetype='application/pdf'
-        )
+def _send_cached_pdf(cache_key, filename='document.pdf'):
+    # Response for an already rendered PDF, or None on a cache miss
+    pdf_bytes = PDF_CACHE.get_memory(cache_key)
+    if pdf_bytes is not None:
+        return _send_pdf(io.BytesIO(pdf_bytes), cache_key, 'HIT', f'/api/pdf/{cache_key}', filename)
+    cached_path = PDF_CACHE.get_path(cache_key)
+    if cached_path is not None:
+        try:
+            # Sent from the cache file (sendfile when the WSGI server supports it)
+            return _send_pdf(cached_path, cache_key, 'HIT', f'/api/pdf/{cache_key}', filename)
+        except OSError:
+            pass  # evicted in the meantime
+    pdf_bytes = PDF_CACHE.get(cache_key)
+    if pdf_bytes is not None:
+        return _send_pdf(io.BytesIO(pdf_bytes), cache_key, 'HIT', f'/api/pdf/{cache_key}', filename)
+    return None
+
+def _mark(stage):
+    # Starts `stage` on the request's StageTimer, if the view is instrumented
+    timer = g.get('timer')
+    if timer is not None:
+        timer.mark(stage)
+
+def _dump_profile(profiler, pipeline, elapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{pipeline}-{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    app.logger.warning(f"Slow {pipeline} request ({elapsed:.2f}s), profile written to {path}")
+
+def _on_body_closed(response, callback):
+    # send_file responses are passed through to the WSGI server without going
+    # through Response.close, so hook the file wrapper the server closes instead
+    body = response.response
+    if response.direct_passthrough and hasattr(body, 'close'):
+        close = body.close
+        def close_and_notify():
+            try:
+                close()
+            finally:
+                callback()
+        body.close = close_and_notify
+    else:
+        response.call_on_close(callback)
+
+def instrumented(pipeline):
+    # Per-stage timings for a view: recorded in STAGE_SECONDS, optionally echoed
+    # in a Server-Timing header, and profiled when PROFILE_SLOW_MS is set
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.timer = timer = StageTimer(STAGE_ALIASES)
+            # Requests overlapping a profiled one are timed but not profiled
+            profiler = None
+            if PROFILE_SLOW_MS > 0 and PROFILE_LOCK.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Another profiler (not ours) is already active
+                    PROFILE_LOCK.release()
+                    profiler = None
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            finally:
+                if profiler:
+                    profiler.disable()
+                    PROFILE_LOCK.release()
+            timer.stop()
+            elapsed = timer.total()
+            for stage, seconds in timer.durations:
+                STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=stage)
+            REQUEST_SECONDS.observe(elapsed, pipeline=pipeline, status=str(response.status_code))
+            if SERVER_TIMING or request.args.get('timing'):
+                response.headers['Server-Timing'] = timer.server_timing()
+                response.headers['Timing-Allow-Origin'] = frontend_url
+            if profiler and elapsed * 1000 >= PROFILE_SLOW_MS:
+                _dump_profile(profiler, pipeline, elapsed)
+            # Body transfer (send_file) happens after the view returns
+            send_started = time.perf_counter()
+            _on_body_closed(response, lambda: STAGE_SECONDS.observe(
+                time.perf_counter() - send_started, pipeline=pipeline, stage='send'))
+            return response
+        return wrapper
+    return decorator
+
+def _form_value(value):
+    # Query string / form fields are strings: "true" and "false" become booleans
+    if value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    return value
+
+def _decode_html(raw, charset=None):
+    # The HTTP charset wins over the document's own declaration. Without one, the
+    # charset declared in the document is used; UTF-8 bytes stay bytes for the cleaner
+    encoding = normalize_charset(charset) if charset else None
+    if encoding:
+        return raw.decode(encoding, errors='replace')
+    encoding = declared_charset(raw)
+    if is_utf8(encoding):
+        return raw
+    return raw.decode(encoding, errors='replace')
+
+def _load_book(book_id):
+    # Returns (HTML bytes, None) or (None, error response)
+    try:
+        book_id = int(book_id)
+    except (TypeError, ValueError):
+        return None, (jsonify({"error": "book_id must be an integer."}), 400)
+    if book_id <= 0:
+        return None, (jsonify({"error": "book_id must be positive."}), 400)
+    _mark('fetch')
+    try:
+        return BOOK_STORE.get(book_id), None
+    except BookNotFound:
+        return None, (jsonify({"error": "Unknown Gutenberg book."}), 404)
+    except SourceError as e:
+        app.logger.error(f"Gutenberg fetch failed: {e}")
+        return None, (jsonify({"error": "Could not fetch the book from Project Gutenberg."}), 502)
+
+def _parse_convert_request():
+    # Returns (payload, None) or (None, error response). Accepts a JSON body, a raw
+    # text/html body with the options in the query string, or a multipart upload
+    # with an "html" file part and the options as form fields. JSON and raw bodies
+    # may be gzip, deflate or br encoded; the limit applies to the decoded size.
+    too_large = (jsonify({"error": "Request payload is too large."}), 413)
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return None, too_large
+
+    _mark('decode')
+    try:
+        if request.mimetype == 'multipart/form-data':
+            if request.content_encoding:
+                return None, (jsonify({"error": "Content-Encoding is not supported for multipart uploads."}), 415)
+            upload = request.files.get('html')
+            if upload is None:
+                return None, (jsonify({"error": "An 'html' file part is required."}), 400)
+            data = {key: _form_value(value) for key, value in request.form.items()}
+            data['html_content'] = _decode_html(upload.read(), upload.mimetype_params.get('charset'))
+        elif request.is_json or request.mimetype == 'text/html':
+            body = spool_body(request.stream, request.content_encoding, MAX_UPLOAD_BYTES, UPLOAD_SPOOL_BYTES)
+            with body:
+                if request.is_json:
+                    data = json.load(io.TextIOWrapper(body, encoding='utf-8'))
+                    if not isinstance(data, dict):
+                        return None, (jsonify({"error": "JSON body must be an object."}), 400)
+                else:
+                    data = {key: _form_value(value) for key, value in request.args.items()}
+                    data['html_content'] = _decode_html(body.read(), request.mimetype_params.get('charset'))
+        else:
+            return None, (jsonify({"error": "Unsupported Media Type. Must be application/json, text/html "
+                                            "or multipart/form-data."}), 415)
+    except (BodyTooLarge, RequestEntityTooLarge):
+        return None, too_large
+    except UnsupportedEncoding:
+        return None, (jsonify({"error": "Unsupported Content-Encoding. Use gzip, deflate or br."}), 415)
+    except LookupError:
+        return None, (jsonify({"error": "Unknown charset."}), 415)
+    except ValueError:
+        return None, (jsonify({"error": "Request body could not be decoded."}), 400)
+
+    # A Gutenberg book id instead of the HTML: read from the book store
+    if not data.get('html_content') and data.get('book_id') is not None:
+        html_content, error = _load_book(data['book_id'])
+        if error:
+            return None, error
+        data['html_content'] = html_content
+
+    if not data.get('html_content'):
+        return None, (jsonify({"error": "html_content is required."}), 400)
+    if data.get('profile', DEFAULT_PROFILE) not in PAGE_PROFILES:
+        return None, (jsonify({"error": f"profile must be one of {sorted(PAGE_PROFILES)}."}), 400)
+    return data, None
+
+def _convert_preview(data, html_content, source_key, title, author, profile):
+    # preview_pages=N renders only the first N pages; preview_format "png"
+    # returns them as thumbnails in JSON instead of a PDF
+    try:
+        pages = int(data['preview_pages'])
+        width_px = int(data.get('thumbnail_width', 300))
+    except (TypeError, ValueError):
+        return jsonify({"error": "preview_pages and thumbnail_width must be integers."}), 400
+    if not 1 <= pages <= MAX_PREVIEW_PAGES:
+        return jsonify({"error": f"preview_pages must be between 1 and {MAX_PREVIEW_PAGES}."}), 400
+    if not 50 <= width_px <= 1200:
+        return jsonify({"error": "thumbnail_width must be between 50 and 1200."}), 400
+    preview_format = data.get('preview_format', 'pdf')
+    if preview_format not in ('pdf', 'png'):
+        return jsonify({"error": "preview_format must be 'pdf' or 'png'."}), 400
+
+    cache_key = content_key(source_key, title, author, stylesheet_version(profile), 'preview', pages)
+    pdf_bytes = PDF_CACHE.get(cache_key)
+    if pdf_bytes is None:
+        started = time.perf_counter()
+        pdf_bytes = render_preview(html_content, title, author, pages, profile, progress=g.timer.mark)
+        g.timer.mark('store')
+        OUTPUT_BYTES.observe(len(pdf_bytes), pipeline='preview')
+        PDF_CACHE.put(cache_key, pdf_bytes, cost=time.perf_counter() - started)
+        cache_status = 'MISS'
+    else:
+        cache_status = 'HIT'
+    if preview_format == 'png':
+        g.timer.mark('thumbnails')
+        thumbnails = preview_thumbnails(pdf_bytes, width_px)
+        return jsonify({"pages": len(thumbnails), "thumbnails": thumbnails}), 200, {'X-Cache': cache_status}
+    return _send_pdf(io.BytesIO(pdf_bytes), cache_key, cache_status, f'/api/pdf/{cache_key}', 'preview.pdf')
+
+def _parse_optimize_options(data):
+    # Returns ({'dpi', 'quality'} or None when not requested, None) or (None, error response)
+    optimize = data.get('optimize')
+    if isinstance(optimize, str):
+        # JSON bodies may send the form-style strings
+        optimize = {'true': True, 'false': False}.get(optimize.lower(), optimize)
+    if optimize is None or optimize is False:
+        return None, None
+    if optimize is not True:
+        return None, (jsonify({"error": "optimize must be true or false."}), 400)
+    try:
+        dpi = int(data.get('image_dpi', DEFAULT_IMAGE_DPI))
+        quality = int(data.get('image_quality', DEFAULT_JPEG_QUALITY))
+    except (TypeError, ValueError):
+        return None, (jsonify({"error": "image_dpi and image_quality must be integers."}), 400)
+    if not 50 <= dpi <= 600:
+        return None, (jsonify({"error": "image_dpi must be between 50 and 600."}), 400)
+    if not 10 <= quality <= 95:
+        return None, (jsonify({"error": "image_quality must be between 10 and 95."}), 400)
+    return {'dpi': dpi, 'quality': quality}, None
+
+@app.route('/api/convert', methods=['POST'])
+@instrumented('convert')
+def convert_to_pdf():
+    try:
+        data, error = _parse_convert_request()
+        if error:
+            return error
+        html_content = data.get('html_content')
+        title = data.get('title')
+        author = data.get('author')
+        profile = data.get('profile', DEFAULT_PROFILE)
+        # "sharded" renders chapters in parallel worker processes
+        mode = data.get('mode', 'standard')
+        if mode not in ('standard', 'sharded'):
+            return jsonify({"error": "mode must be 'standard' or 'sharded'."}), 400
+        # "optimize" downsamples images, subsets fonts and merges duplicates (optimize.py)
+        optimize, error = _parse_optimize_options(data)
+        if error:
+            return error
+
+        _mark('cache')
+        source_key = content_key(html_content)
+        if data.get('preview_pages') is not None:
+            return _convert_preview(data, html_content, source_key, title, author, profile)
+
+        cache_key = content_key(source_key, title, author, stylesheet_version(profile), mode,
+                                *(('optimize', optimize['dpi'], optimize['quality']) if optimize else ()))
+        response = _send_cached_pdf(cache_key)
+        if response is not None:
+            return response
+
+        started = time.perf_counter()
+        stats = {}
+        # Rolls over to a temporary file once the PDF exceeds PDF_SPOOL_BYTES
+        spool = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES)
+        try:
+            render_pdf(html_content, title, author, progress=g.timer.mark, sharded=(mode == 'sharded'),
+                       profile=profile, target=spool, stats=stats, source_key=source_key)
+            bytes_saved = None
+            if optimize:
+                g.timer.mark('optimize')
+                spool.seek(0)
+                original = spool.read()
+                optimized = optimize_pdf_bytes(original, optimize['dpi'], optimize['quality'])
+                del original
+                # Re-encoding can grow already compact files: never reported as negative
+                bytes_saved = max(0, spool.tell() - len(optimized))
+                OPTIMIZE_SAVED_BYTES.inc(bytes_saved, pipeline=mode)
+                spool.seek(0)
+                spool.truncate()
+                spool.write(optimized)
+            g.timer.mark('store')
+            OUTPUT_BYTES.observe(spool.tell(), pipeline=mode)
+            if 'pages' in stats:
+                OUTPUT_PAGES.observe(stats['pages'], pipeline=mode)
+            cached_path = PDF_CACHE.put_file(cache_key, spool, cost=time.perf_counter() - started)
+        except Exception:
+            spool.close()
+            raise
+        if cached_path is not None:
+            spool.close()
+            response = _send_pdf(cached_path, cache_key, 'MISS', f'/api/pdf/{cache_key}')
+        else:
+            # No disk tier: stream the spooled copy (closed by the response)
+            spool.seek(0)
+            response = _send_pdf(spool, cache_key, 'MISS')
+        if bytes_saved is not None:
+            response.headers['X-Bytes-Saved'] = str(bytes_saved)
+        return response
 
     except Exception as e:
         # Log the exception for debugging purposes
@@ -217,6 +843,195 @@ def convert_to_pdf():
         # Return a generic error message to the user
         return jsonify({"error": "An error occurred during PDF conversion."}), 500
 
+def _parse_booklet_options(data):
+    # Returns (create_booklet keyword arguments, None) or (None, error response)
+    try:
+        signature = int(data.get('signature', 16))
+        gutter_mm = float(data.get('gutter', 0.0))
+        creep_mm = float(data.get('creep', 0.0))
+    except (TypeError, ValueError):
+        return None, (jsonify({"error": "signature, gutter and creep must be numbers."}), 400)
+    if signature <= 0 or signature % 4 != 0:
+        return None, (jsonify({"error": "signature must be a positive multiple of 4."}), 400)
+    if gutter_mm < 0 or creep_mm < 0:
+        return None, (jsonify({"error": "gutter and creep must not be negative."}), 400)
+    pad_mode = data.get('pad', 'blank')
+    if pad_mode not in ('blank', 'last'):
+        return None, (jsonify({"error": "pad must be 'blank' or 'last'."}), 400)
+    # "gb" adds two leading blank pages, "book" replaces the covers with 2+2 blanks
+    binding = data.get('binding', 'gb')
+    if binding not in ('gb', 'book'):
+        return None, (jsonify({"error": "binding must be 'gb' or 'book'."}), 400)
+    # Folded (fold2/4/8) or cut-and-stack (stack2/4/8) scheme, "auto" for the fewest sheets
+    imposition = data.get('imposition', DEFAULT_LAYOUT)
+    if imposition not in LAYOUTS and imposition != 'auto':
+        return None, (jsonify({"error": f"imposition must be one of {sorted(LAYOUTS)} or 'auto'."}), 400)
+    # With "auto", a sheet restricts the choice to that format
+    sheet = data.get('sheet', None if imposition == 'auto' else DEFAULT_SHEET)
+    if sheet is not None and sheet not in SHEET_FORMATS:
+        return None, (jsonify({"error": f"sheet must be one of {sorted(SHEET_FORMATS)}."}), 400)
+    return {
+        'signature': signature,
+        'gutter_mm': gutter_mm,
+        'creep_mm': creep_mm,
+        'pad_mode': pad_mode,
+        'book': binding == 'book',
+        'gb': binding == 'gb',
+        'imposition': imposition,
+        'sheet': sheet,
+    }, None
+
+@app.route('/api/booklet', methods=['POST'])
+@instrumented('booklet')
+def convert_to_booklet():
+    # HTML -> clean -> render -> impose, entirely in memory
+    try:
+        data, error = _parse_convert_request()
+        if error:
+            return error
+        options, error = _parse_booklet_options(data)
+        if error:
+            return error
+        optimize, error = _parse_optimize_options(data)
+        if error:
+            return error
+        if optimize:
+            options.update(image_dpi=optimize['dpi'], image_quality=optimize['quality'])
+        html_content = data.get('html_content')
+        title = data.get('title')
+        author = data.get('author')
+        profile = data.get('profile', DEFAULT_PROFILE)
+
+        _mark('cache')
+        source_key = content_key(html_content)
+        pdf_key = content_key(source_key, title, author, stylesheet_version(profile), 'standard')
+        booklet_key = content_key(pdf_key, 'booklet', *(f'{k}={v}' for k, v in sorted(options.items())))
+        response = _send_cached_pdf(booklet_key, 'booklet.pdf')
+        if response is not None:
+            return response
+
+        started = time.perf_counter()
+        pdf_bytes = PDF_CACHE.get(pdf_key)
+        if pdf_bytes is None:
+            stats = {}
+            pdf_bytes = render_pdf(html_content, title, author, progress=g.timer.mark, profile=profile, stats=stats,
+                                   source_key=source_key)
+            OUTPUT_BYTES.observe(len(pdf_bytes), pipeline='standard')
+            OUTPUT_PAGES.observe(stats['pages'], pipeline='standard')
+            g.timer.mark('store')
+            PDF_CACHE.put(pdf_key, pdf_bytes, cost=time.perf_counter() - started)
+        stats = {}
+        booklet_bytes = create_booklet(pdf_bytes, progress=g.timer.mark, stats=stats,
+                                       low_memory=BOOKLET_LOW_MEMORY_PAGES, **options)
+        g.timer.mark('store')
+        OUTPUT_BYTES.observe(len(booklet_bytes), pipeline='booklet')
+        OUTPUT_PAGES.observe(stats['pages'], pipeline='booklet')
+        PDF_CACHE.put(booklet_key, booklet_bytes, cost=time.perf_counter() - started)
+        response = _send_pdf(io.BytesIO(booklet_bytes), booklet_key, 'MISS', f'/api/pdf/{booklet_key}', 'booklet.pdf')
+        if 'image_bytes_saved' in stats:
+            # Only the image streams are measured here, not the whole PDF as X-Bytes-Saved on /api/convert
+            image_bytes_saved = max(0, stats['image_bytes_saved'])
+            OPTIMIZE_SAVED_BYTES.inc(image_bytes_saved, pipeline='booklet')
+            response.headers['X-Image-Bytes-Saved'] = str(image_bytes_saved)
+        return response
+
+    except Exception as e:
+        app.logger.error(f"Booklet conversion failed: {e}")
+        return jsonify({"error": "An error occurred during booklet conversion."}), 500
+
+@app.route('/api/pdf/<cache_key>', methods=['GET'])
+def cached_pdf(cache_key):
+    # Range / If-Range / If-None-Match aware download of an already rendered PDF
+    if not re.fullmatch(r'[0-9a-f]{64}', cache_key):
+        return jsonify({"error": "Unknown PDF."}), 404
+    response = _send_cached_pdf(cache_key)
+    if response is None:
+        return jsonify({"error": "Unknown PDF."}), 404
+    return response
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    try:
+        data, error = _parse_convert_request()
+        if error:
+            return error
+        html_content = data.get('html_content')
+        title = data.get('title')
+        author = data.get('author')
+        profile = data.get('profile', DEFAULT_PROFILE)
+
+        source_key = content_key(html_content)
+        cache_key = content_key(source_key, title, author, stylesheet_version(profile), 'standard')
+        cached_path = PDF_CACHE.get_path(cache_key)
+        pdf_bytes = None if cached_path else PDF_CACHE.get(cache_key)
+        if cached_path or pdf_bytes is not None:
+            try:
+                size = os.path.getsize(cached_path) if cached_path else len(pdf_bytes)
+            except OSError:
+                size = None
+            job_id = RENDER_JOBS.add_finished(cache_key, size)
+        else:
+            def store_result(job):
+                PDF_CACHE.put(cache_key, job['result'], cost=job['finished'] - job['started'])
+            # The job keeps only the cache key; /api/jobs/<id>/pdf is served from PDF_CACHE
+            job_id = RENDER_JOBS.submit(render_pdf, html_content, title, author, profile=profile,
+                                        source_key=source_key, on_done=store_result, key=cache_key)
+
+        return jsonify(RENDER_JOBS.status(job_id)), 202, {'Location': f'/api/jobs/{job_id}'}
+
+    except QueueFull:
+        return jsonify({"error": "Too many conversions in progress. Retry later."}), 429, {'Retry-After': '10'}
+    except Exception as e:
+        app.logger.error(f"Job submission failed: {e}")
+        return jsonify({"error": "An error occurred while queuing the conversion."}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = RENDER_JOBS.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/pdf', methods=['GET'])
+def job_result(job_id):
+    job = RENDER_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    if job['status'] == FAILED:
+        app.logger.error(f"PDF conversion failed: {job['error']}")
+        return jsonify({"error": "An error occurred during PDF conversion."}), 500
+    if job['status'] != DONE:
+        return jsonify(RENDER_JOBS.status(job_id)), 409
+
+    response = _send_cached_pdf(job['key'])
+    if response is None:
+        return jsonify({"error": "The PDF of this job is no longer cached. Submit it again."}), 410
+    return response
+
+@app.route('/api/books/<int:book_id>', methods=['GET'])
+def book_html(book_id):
+    # Book HTML from the server-side store, so the browser needs no CORS proxy
+    try:
+        path = BOOK_STORE.ensure(book_id)
+    except BookNotFound:
+        return jsonify({"error": "Unknown Gutenberg book."}), 404
+    except SourceError as e:
+        app.logger.error(f"Gutenberg fetch failed: {e}")
+        return jsonify({"error": "Could not fetch the book from Project Gutenberg."}), 502
+    # werkzeug adds charset=utf-8, which holds: the store converts every book to UTF-8
+    return send_file(path, mimetype='text/html', conditional=True)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    # PDF cache counters, plus the cleaned-HTML cache and the book store
+    # Counters are those of the answering process (see README, Production)
+    return jsonify(dict(PDF_CACHE.stats(), clean=CLEAN_CACHE.stats(), books=BOOK_STORE.stats(), pid=os.getpid()))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition format
+    return METRICS.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 if __name__ == '__main__':
     debug_mode = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
     app.run(debug=debug_mode, port=5001)
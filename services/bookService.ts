@@ -10,7 +10,21 @@ export const searchBooks = async (query: string, language: string = 'fr'): Promi
   return data.results;
 };
 
-export const fetchBookContent = async (url: string): Promise<string> => {
+const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:5001';
+
+export const fetchBookContent = async (url: string, bookId?: number): Promise<string> => {
+  // Preferred path: the backend fetches the book once and keeps it in its store
+  if (bookId !== undefined) {
+    try {
+      const response = await fetch(`${API_URL}/api/books/${bookId}`);
+      if (response.ok) {
+        return await response.text();
+      }
+    } catch (error) {
+      console.warn(`Erreur serveur:`, error);
+    }
+  }
+
   // Force HTTPS to avoid mixed content issues
   const targetUrl = url.replace(/^http:\/\//i, 'https://');
   
@@ -44,19 +58,35 @@ export const fetchBookContent = async (url: string): Promise<string> => {
   throw new Error("Impossible de récupérer le contenu du livre. Les serveurs Project Gutenberg limitent parfois l'accès.");
 };
 
-export const convertToPdf = async (htmlContent: string, title: string, author: string): Promise<Blob> => {
-  const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:5001';
-  const response = await fetch(`${apiUrl}/api/convert`, {
+// Gzip the request body when the browser supports CompressionStream (books are often several MB)
+const compressBody = async (body: string): Promise<{ body: BodyInit; headers: Record<string, string> }> => {
+  if (typeof CompressionStream === 'undefined') {
+    return { body, headers: {} };
+  }
+  const stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+  return { body: await new Response(stream).blob(), headers: { 'Content-Encoding': 'gzip' } };
+};
+
+const postConvert = async (payload: Record<string, unknown>): Promise<Response> => {
+  const { body, headers } = await compressBody(JSON.stringify(payload));
+  return fetch(`${API_URL}/api/convert`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
+      ...headers,
     },
-    body: JSON.stringify({
-      html_content: htmlContent,
-      title: title,
-      author: author,
-    }),
+    body,
   });
+};
+
+export const convertToPdf = async (htmlContent: string, title: string, author: string, bookId?: number): Promise<Blob> => {
+  // With a Gutenberg id the server reads the book from its store: the HTML is not uploaded again
+  let response = bookId !== undefined
+    ? await postConvert({ book_id: bookId, title: title, author: author })
+    : null;
+  if (!response || response.status === 404 || response.status === 502) {
+    response = await postConvert({ html_content: htmlContent, title: title, author: author });
+  }
 
   if (!response.ok) {
     throw new Error('Failed to convert to PDF');
@@ -0,0 +1,189 @@
+"""
+sharding.py
+Chapter-sharded rendering: the cleaned document is split at its
+`section-break` headings (each already starts a new page), the shards are
+laid out in parallel worker processes and the resulting PDFs are stitched
+back together. Page numbers are stamped after the merge so they run across
+the whole book instead of restarting in every shard; bookmarks and links
+between shards are restored after the merge too.
+"""
+import copy
+import functools
+
+import fitz  # PyMuPDF
+import lxml.html
+from lxml import etree
+
+# Links to an anchor rendered in another shard, rewritten back after the merge
+SHARD_LINK_PREFIX = 'gutenprint-shard:'
+
+# Shards are rendered without margin-box page numbers; they are added after the merge
+NO_PAGE_NUMBERS_CSS = """
+    @page {
+        @bottom-center {
+            content: none;
+        }
+    }
+"""
+
+
+def split_sections(cleaned_html, min_shards=2):
+    """
+    Split a document produced by clean_gutenberg_html into standalone HTML
+    documents, one per section-break. The <head> is copied into every shard.
+    Links to an anchor of another shard are rewritten to SHARD_LINK_PREFIX
+    URIs, resolved after the merge (resolve_shard_links). Returns [] when the
+    document has fewer than `min_shards` sections.
+    """
+    root = lxml.html.document_fromstring(cleaned_html)
+    body = root.find('body')
+    if body is None:
+        return []
+    groups = [[]]
+    for element in body:
+        if (isinstance(element.tag, str) and 'section-break' in (element.get('class') or '').split()
+                and groups[-1]):
+            groups.append([])
+        groups[-1].append(element)
+    if len(groups) < min_shards:
+        return []
+
+    # Anchor (id or <a name>) -> shard holding it
+    anchors = {}
+    for index, group in enumerate(groups):
+        for element in group:
+            if isinstance(element.tag, str):
+                for name in element.xpath('descendant-or-self::*/@id | descendant-or-self::a/@name'):
+                    anchors.setdefault(name, index)
+    head = root.find('head')
+    shards = []
+    for index, group in enumerate(groups):
+        shard = etree.Element('html')
+        if head is not None:
+            shard.append(copy.deepcopy(head))
+        shard_body = etree.SubElement(shard, 'body')
+        if index == 0:
+            shard_body.text = body.text
+        for element in group:
+            shard_body.append(element)
+            if not isinstance(element.tag, str):
+                continue
+            for link in element.iter('a'):
+                href = link.get('href') or ''
+                if href.startswith('#') and anchors.get(href[1:], index) != index:
+                    link.set('href', SHARD_LINK_PREFIX + href[1:])
+        shards.append(etree.tostring(shard, method='html', encoding='unicode'))
+    return shards
+
+
+@functools.lru_cache(maxsize=None)
+def _font_config():
+    from weasyprint.text.fonts import FontConfiguration
+    return FontConfiguration()
+
+
+@functools.lru_cache(maxsize=8)
+def _compiled_stylesheets(css_strings):
+    from weasyprint import CSS
+    return [CSS(string=css, font_config=_font_config()) for css in css_strings]
+
+
+def render_shard(html, css_strings):
+    # Runs in a worker process; stylesheets and fonts are set up once per worker
+    from weasyprint import HTML
+    return HTML(string=html).write_pdf(
+        stylesheets=_compiled_stylesheets(tuple(css_strings)), font_config=_font_config()
+    )
+
+
+def stamp_page_numbers(doc, skip_first=2, margin_bottom_pt=28.35, font_size=12):
+    """Write centered page numbers in the bottom margin, like `counter(page)` would."""
+    for page in doc:
+        if page.number < skip_first:
+            continue
+        label = str(page.number + 1)
+        width = fitz.get_text_length(label, fontname='tiro', fontsize=font_size)
+        x = (page.rect.width - width) / 2.0
+        # Baseline roughly centered in the bottom margin
+        y = page.rect.height - margin_bottom_pt / 2.0 + font_size / 3.0
+        page.insert_text((x, y), label, fontname='tiro', fontsize=font_size)
+
+
+def merge_shards(pdf_shards):
+    """
+    Concatenate the shard PDFs. insert_pdf copies neither the outlines nor
+    the named destinations: the bookmarks are rebuilt from every shard's TOC
+    and the cross-shard links resolved against the shards' destinations.
+    """
+    out_doc = fitz.open()
+    toc = []
+    destinations = {}
+    for pdf_bytes in pdf_shards:
+        with fitz.open(stream=pdf_bytes, filetype='pdf') as shard_doc:
+            offset = len(out_doc)
+            toc.extend([level, title, page + offset] for level, title, page in shard_doc.get_toc() if page > 0)
+            matrices = {}
+            for name, dest in shard_doc.resolve_names().items():
+                page = dest.get('page', -1)
+                if page < 0 or name in destinations:
+                    continue
+                point = None
+                if dest.get('to'):
+                    # Given in PDF coordinates (origin bottom-left)
+                    if page not in matrices:
+                        matrices[page] = shard_doc[page].transformation_matrix
+                    point = fitz.Point(dest['to']) * matrices[page]
+                destinations[name] = (page + offset, point)
+            out_doc.insert_pdf(shard_doc)
+    if toc:
+        out_doc.set_toc(_normalize_toc(toc))
+    resolve_shard_links(out_doc, destinations)
+    return out_doc
+
+
+def _normalize_toc(toc):
+    # set_toc needs a first level of 1 and no level jumping more than one deeper
+    normalized = []
+    previous = 0
+    for level, title, page in toc:
+        level = max(1, min(level, previous + 1))
+        normalized.append([level, title, page])
+        previous = level
+    return normalized
+
+
+def resolve_shard_links(doc, destinations):
+    """Turn SHARD_LINK_PREFIX links into links to the named destination, wherever it ended up."""
+    for page in doc:
+        for link in page.get_links():
+            uri = link.get('uri') or ''
+            if link['kind'] != fitz.LINK_URI or not uri.startswith(SHARD_LINK_PREFIX):
+                continue
+            page.delete_link(link)
+            target = destinations.get(uri[len(SHARD_LINK_PREFIX):])
+            if target is None:
+                continue  # anchor WeasyPrint did not keep: the link is dropped, like in a single render
+            target_page, point = target
+            page.insert_link({'kind': fitz.LINK_GOTO, 'from': link['from'], 'page': target_page,
+                              'to': point or fitz.Point(0, 0)})
+
+
+def render_sharded(cleaned_html, css_strings, executor, stats=None, **stamp_options):
+    """
+    Render `cleaned_html` shard by shard on `executor` and return the merged
+    PDF bytes, or None when the document has too few sections to be worth it.
+    The page count is stored in the optional `stats` dict.
+    """
+    shards = split_sections(cleaned_html)
+    if not shards:
+        return None
+    css_strings = tuple(css_strings) + (NO_PAGE_NUMBERS_CSS,)
+    pdf_shards = list(executor.map(render_shard, shards, [css_strings] * len(shards)))
+    out_doc = merge_shards(pdf_shards)
+    if stats is not None:
+        stats['pages'] = len(out_doc)
+    try:
+        stamp_page_numbers(out_doc, **stamp_options)
+        return out_doc.tobytes(garbage=3, deflate=True)
+    finally:
+        out_doc.close()
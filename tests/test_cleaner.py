@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Sorties de référence du nettoyeur Gutenberg (server.clean_gutenberg_html).
+Chaque fixture fixtures/cleaner/<nom>.html a sa sortie attendue dans
+<nom>.expected.html, produite par l'ancienne version BeautifulSoup du
+nettoyeur. Différences acceptées avec cette sortie, sans effet sur le
+document rendu, ignorées par canonical() :
+- éléments vides sérialisés en HTML (<br>, <img ...>) et non en <br/> ;
+- ordre des attributs et guillemets autour de leurs valeurs ;
+- pas de ligne vide entre le DOCTYPE et <html>.
+L'indentation des éléments du <head>, que l'ancienne version retirait, est
+aussi conservée (les fixtures n'en ont pas).
+Le DOCTYPE (présent seulement s'il l'est dans la source) et le charset
+déclaré (toujours utf-8) doivent être identiques.
+no_body.html faisait échouer l'ancienne version (ValueError) : sa sortie
+attendue est celle du nettoyeur actuel.
+"""
+from pathlib import Path
+import re
+import sys
+
+import lxml.html
+from lxml import etree
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import server
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'cleaner'
+DOCTYPE_RE = re.compile(r'\s*(<!DOCTYPE[^>]*>)?', re.IGNORECASE)
+# Page de titre des fixtures qui en ont une
+TITLES = {'header_footer': ('Contes & légendes', 'Anonyme')}
+
+def fixture_names():
+    return sorted(path.name[:-len('.html')] for path in FIXTURES.glob('*.html')
+                  if not path.name.endswith('.expected.html'))
+
+def canonical(html):
+    # DOCTYPE tel quel, puis le document en forme canonique (C14N : attributs triés, balises fermées)
+    root = lxml.html.document_fromstring(html, parser=lxml.html.HTMLParser(default_doctype=False))
+    return DOCTYPE_RE.match(html).group(1), etree.tostring(root, method='c14n').decode('utf-8')
+
+@pytest.mark.parametrize('name', fixture_names())
+def test_matches_baseline(name):
+    source = (FIXTURES / f'{name}.html').read_text(encoding='utf-8')
+    expected = (FIXTURES / f'{name}.expected.html').read_text(encoding='utf-8')
+    cleaned = server.clean_gutenberg_html(source, *TITLES.get(name, ()))
+    assert canonical(cleaned) == canonical(expected)
+
+def test_no_doctype_added():
+    cleaned = server.clean_gutenberg_html('<h2>Chapitre I</h2><p>Texte.</p>')
+    assert '<!DOCTYPE' not in cleaned
+
+def test_declared_charset_becomes_utf8():
+    source = ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1">'
+              '</head><body><p>Texte.</p></body></html>')
+    cleaned = server.clean_gutenberg_html(source)
+    assert 'content="text/html; charset=utf-8"' in cleaned
+    assert 'ISO-8859-1' not in cleaned
+
+@pytest.mark.parametrize('declaration', [
+    '<meta charset="iso-8859-1">',
+    '<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1">',
+])
+def test_bytes_decoded_with_declared_charset(declaration):
+    source = f'<html><head>{declaration}</head><body><h2>Chapitre I</h2><p>Été, « café »</p></body></html>'
+    cleaned = server.clean_gutenberg_html(source.encode('iso-8859-1'))
+    assert '<p>Été, « café »</p>' in cleaned
+
+def test_bytes_without_declaration_are_utf8():
+    cleaned = server.clean_gutenberg_html('<h2>Chapitre I</h2><p>Été, « café »</p>'.encode('utf-8'))
+    assert '<p>Été, « café »</p>' in cleaned
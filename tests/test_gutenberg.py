@@ -0,0 +1,23 @@
+"""BookStore shared between processes (gunicorn workers) through one directory."""
+import json
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from gutenberg import BookStore, MirrorSource
+
+
+def test_index_keeps_books_stored_by_another_store(tmp_path):
+    mirror = tmp_path / 'mirror'
+    mirror.mkdir()
+    for book_id in (1, 2, 3):
+        (mirror / f'{book_id}.html').write_text(f'<p>{book_id}</p>', encoding='utf-8')
+    directory = tmp_path / 'books'
+    a = BookStore(str(directory), MirrorSource(str(mirror)))
+    b = BookStore(str(directory), MirrorSource(str(mirror)))
+    a.ensure(1)
+    b.ensure(2)
+    a.ensure(3)
+    with open(directory / BookStore.INDEX_FILE, encoding='utf-8') as f:
+        assert sorted(json.load(f)) == ['1', '2', '3']
+    assert a.stats()['books'] == 3
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Géométrie des schémas d'imposition (booklet.compute_cell_rects) et choix "auto"."""
+from pathlib import Path
+import sys
+
+import fitz  # PyMuPDF
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import booklet
+from imposition import LAYOUTS, SHEET_FORMATS, sheet_size
+
+OVERLAP_PT = booklet.mm_to_pt(0.2)
+
+@pytest.mark.parametrize('name', sorted(LAYOUTS))
+@pytest.mark.parametrize('sheet', sorted(SHEET_FORMATS))
+@pytest.mark.parametrize('gutter_mm', [0, 5, 20])
+def test_cells_of_a_side_never_overlap(name, sheet, gutter_mm):
+    layout = LAYOUTS[name]
+    sheet_w, sheet_h = sheet_size(layout, sheet)
+    rects = booklet.compute_cell_rects(layout, sheet_w, sheet_h, booklet.mm_to_pt(gutter_mm), (0.0, 0.0, 0.0, 0.0),
+                                       overlap_pt=OVERLAP_PT)
+    assert len(rects) == layout.cols * layout.rows
+    # Seules les deux pages d'un même dos se recouvrent, d'au plus OVERLAP_PT
+    for i, a in enumerate(rects):
+        for j, b in enumerate(rects[i + 1:], i + 1):
+            overlap_w = min(a[2], b[2]) - max(a[0], b[0])
+            overlap_h = min(a[3], b[3]) - max(a[1], b[1])
+            spine_pair = layout.folds and i // 2 == j // 2 and i // layout.cols == j // layout.cols
+            assert overlap_h <= 1e-6 or overlap_w <= (OVERLAP_PT if spine_pair else 0.0) + 1e-6
+
+def test_overlapping_cells_are_rejected():
+    with pytest.raises(ValueError):
+        booklet.check_cells_disjoint([(0, 0, 10, 10), (5, 0, 15, 10)], overlap_pt=1.0)
+
+@pytest.fixture(scope='module')
+def source_pdf():
+    doc = fitz.open()
+    for _ in range(200):
+        doc.new_page(width=booklet.A4_WIDTH_PT, height=booklet.A4_HEIGHT_PT)
+    return doc.tobytes()
+
+@pytest.mark.parametrize('sheet', sorted(SHEET_FORMATS))
+def test_auto_keeps_the_requested_sheet(source_pdf, sheet):
+    stats = {}
+    booklet.create_booklet(source_pdf, gb=True, imposition='auto', sheet=sheet, stats=stats)
+    assert stats['sheet'] == sheet
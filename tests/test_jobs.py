@@ -0,0 +1,74 @@
+"""JobQueue: background renders in a process pool."""
+from pathlib import Path
+import os
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from jobs import DONE, FAILED, JobQueue
+
+
+def crash(progress=None):
+    os._exit(1)
+
+
+def render(size, progress=None):
+    progress('work', 0.5)
+    return b'%' * size
+
+
+def worker_pid(progress=None):
+    return str(os.getpid()).encode()
+
+
+def wait(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status['status'] in (DONE, FAILED):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {status['status']}")
+
+
+def test_pool_replaced_after_a_worker_dies():
+    queue = JobQueue(max_workers=1, max_queued=1)
+    assert wait(queue, queue.submit(crash))['status'] == FAILED
+    job_ids = [queue.submit(render, 10) for _ in range(2)]
+    assert [wait(queue, job_id)['status'] for job_id in job_ids] == [DONE, DONE]
+    assert queue.pending() == 0
+
+
+def test_done_only_once_stored():
+    queue = JobQueue(max_workers=1)
+    stored = {}
+    seen = []
+
+    def store(job):
+        # Slow store (e.g. a large PDF written to the disk cache)
+        seen.append(queue.status(job['id'])['status'])
+        time.sleep(0.2)
+        stored[job['key']] = job['result']
+
+    job_id = queue.submit(render, 10, on_done=store, key='k')
+    status = wait(queue, job_id)
+    assert status['status'] == DONE and status['size'] == 10
+    assert seen != [DONE] and stored['k'] == b'%' * 10
+    assert queue.get(job_id)['result'] is None
+
+
+def test_failed_store_fails_the_job():
+    queue = JobQueue(max_workers=1)
+
+    def store(job):
+        raise OSError("disk full")
+
+    status = wait(queue, queue.submit(render, 10, on_done=store, key='k'))
+    assert status['status'] == FAILED and status['error'] == "disk full"
+
+
+def test_pool_replaced_after_max_tasks_per_child():
+    queue = JobQueue(max_workers=1, max_tasks_per_child=2)
+    job_ids = [queue.submit(worker_pid) for _ in range(3)]
+    pids = [bytes(queue.get(job_id)['result']) for job_id in job_ids if wait(queue, job_id)['status'] == DONE]
+    assert len(pids) == 3 and pids[0] == pids[1] != pids[2]
@@ -19,4 +19,5 @@ export interface HtmlBook {
   author: string;
   htmlContent: string;
   htmlUrl: string;
+  bookId?: number; // identifiant Gutenberg : le serveur relit le livre dans son stock
 }
@@ -0,0 +1,116 @@
+"""
+uploads.py
+Streaming request-body reader for the conversion endpoints. gzip, deflate
+and br bodies are decompressed chunk by chunk into a spooled temporary file,
+and the decoded size is checked against a limit as it grows, so a small
+compressed body cannot expand without bound in memory.
+"""
+import tempfile
+import zlib
+
+import brotli
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class UnsupportedEncoding(Exception):
+    pass
+
+
+class _ZlibDecoder:
+    # wbits 32 + MAX_WBITS accepts both gzip and zlib ("deflate") headers
+    def __init__(self):
+        self._obj = zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+    def decode(self, data):
+        while data:
+            out = self._obj.decompress(data, CHUNK_SIZE)
+            data = self._obj.unconsumed_tail
+            if out:
+                yield out
+
+    def finish(self):
+        out = self._obj.flush()
+        if not self._obj.eof:
+            raise ValueError("truncated compressed body")
+        if out:
+            yield out
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+
+    def decode(self, data):
+        yield self._obj.process(data, output_buffer_limit=CHUNK_SIZE)
+        while not self._obj.can_accept_more_data():
+            yield self._obj.process(b'', output_buffer_limit=CHUNK_SIZE)
+
+    def finish(self):
+        # Output still buffered in the decompressor after the last input chunk
+        while not self._obj.is_finished():
+            out = self._obj.process(b'', output_buffer_limit=CHUNK_SIZE)
+            if not out:
+                raise ValueError("truncated compressed body")
+            yield out
+
+
+class _IdentityDecoder:
+    def decode(self, data):
+        yield data
+
+    def finish(self):
+        return ()
+
+
+DECODERS = {
+    'identity': _IdentityDecoder,
+    'gzip': _ZlibDecoder,
+    'x-gzip': _ZlibDecoder,
+    'deflate': _ZlibDecoder,
+    'br': _BrotliDecoder,
+}
+
+
+def spool_body(stream, content_encoding=None, max_bytes=None, spool_bytes=8 * 1024 * 1024):
+    """
+    Copy the readable binary `stream`, decoded according to `content_encoding`,
+    into a SpooledTemporaryFile kept in memory up to `spool_bytes`. Returns the
+    file rewound to the start. Raises BodyTooLarge once more than `max_bytes`
+    decoded bytes are produced, UnsupportedEncoding for an unknown encoding and
+    ValueError for a corrupt or truncated compressed body.
+    """
+    decoder_class = DECODERS.get((content_encoding or 'identity').strip().lower())
+    if decoder_class is None:
+        raise UnsupportedEncoding(content_encoding)
+    decoder = decoder_class()
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    size = 0
+
+    def write(pieces):
+        nonlocal size
+        for piece in pieces:
+            size += len(piece)
+            if max_bytes is not None and size > max_bytes:
+                raise BodyTooLarge(size)
+            spool.write(piece)
+
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            write(decoder.decode(chunk))
+        write(decoder.finish())
+    except (zlib.error, brotli.error) as e:
+        spool.close()
+        raise ValueError(f"invalid {content_encoding} body: {e}") from e
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool